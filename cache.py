@@ -0,0 +1,105 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+
+CACHE_DIR = './datasets/cache/'
+INDEX_NAME = 'index.json'
+
+
+## 원본 파일 해시 구하기
+def file_hash(path, chunk_size=1 << 20):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_signature(path, known=None):
+    # 크기와 mtime 이 그대로면 이전 해시를 재사용하고, 바뀐 경우에만 다시 읽음
+    st = os.stat(path)
+    if known is not None and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+        return known
+    return [st.st_size, st.st_mtime_ns, file_hash(path)]
+
+
+def entry_key(img_sig, label_sig, params):
+    h = hashlib.sha1()
+    h.update(img_sig[2].encode())
+    h.update(label_sig[2].encode())
+    h.update(json.dumps(params, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def link_or_copy(src, dst):
+    # 캐시 파일을 split 디렉토리로 옮길 때는 하드링크를 우선 사용
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+## 전처리 캐시
+class PreprocessCache(object):
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, INDEX_NAME)
+
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+        # 원본 경로 -> [size, mtime_ns, sha1]
+        self.files = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as f:
+                self.files = json.load(f).get('files', {})
+
+    def known(self, path):
+        return self.files.get(os.path.abspath(path))
+
+    def update(self, path, sig):
+        self.files[os.path.abspath(path)] = sig
+
+    def save(self):
+        # 다른 프로세스(DataLoader worker 등)가 먼저 저장한 기록은 유지하고 합침
+        files = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as f:
+                files = json.load(f).get('files', {})
+        files.update(self.files)
+        self.files = files
+
+        tmp_path = '%s.%d.tmp' % (self.index_path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump({'files': self.files}, f)
+        os.replace(tmp_path, self.index_path)
+
+
+def entry_paths(cache_dir, key):
+    sub_dir = os.path.join(cache_dir, key[:2])
+    return os.path.join(sub_dir, key + '_input.npy'), os.path.join(sub_dir, key + '_label.npy')
+
+
+def entry_exists(cache_dir, key):
+    input_path, label_path = entry_paths(cache_dir, key)
+    return os.path.exists(input_path) and os.path.exists(label_path)
+
+
+def write_entry(cache_dir, key, input_, label_):
+    input_path, label_path = entry_paths(cache_dir, key)
+    sub_dir = os.path.dirname(input_path)
+    if not os.path.exists(sub_dir):
+        os.makedirs(sub_dir, exist_ok=True)
+
+    # 같은 이미지를 여러 worker 가 동시에 쓰더라도 깨지지 않도록 임시 파일 후 교체
+    for dst, arr in ((input_path, input_), (label_path, label_)):
+        tmp = '%s.%d.tmp' % (dst, os.getpid())
+        with open(tmp, 'wb') as f:
+            np.save(f, arr)
+        os.replace(tmp, dst)
+
+    return input_path, label_path
@@ -0,0 +1,206 @@
+import os
+import sqlite3
+
+from cache import file_hash
+
+CATALOG_NAME = 'catalog.sqlite'
+CATALOG_VERSION = 2
+
+COLUMNS = ('pos', 'id', 'input', 'input_size', 'input_mtime', 'input_hash',
+           'label', 'label_size', 'label_mtime', 'label_hash')
+
+
+## 데이터 디렉토리의 input / label 파일 목록을 SQLite 로 관리
+class Catalog(object):
+    # input_<id>.npy 와 label_<id>.npy (.npz) 를 위치가 아니라 id 로 짝지어서 저장
+    # - 디렉토리 mtime 이 그대로면 다시 훑지 않음 (파일 추가 / 삭제 / 이름 변경은 디렉토리 mtime 을 바꿈)
+    # - 샘플은 at(pos) / lookup(id) 로 한 줄씩만 읽고, 읽을 때 파일 크기 / mtime 을 확인해서
+    #   제자리에서 다시 쓴 파일도 반영함
+    # - 해시는 hashes() 를 부를 때만 구하고, (크기, mtime) 이 그대로면 저장해 둔 값을 재사용
+    # - 디렉토리에 쓸 수 없으면 catalog 파일 없이 메모리에서만 목록을 만듦
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.path = os.path.join(data_dir, CATALOG_NAME)
+        self.writable = os.access(data_dir, os.W_OK)
+
+        self.conn = None
+        self.pid = None
+        self.rows = None
+        self.pos_of = None
+
+        if self.writable:
+            self._connect()
+        self.update()
+
+    ## 연결 관리 (DataLoader worker 로 넘길 때는 연결을 빼고 worker 에서 다시 연결)
+    def _connect(self):
+        # journal 파일이 디렉토리에 생겼다 지워지면 디렉토리 mtime 이 바뀌므로 journal 은 메모리에 둠
+        # (catalog 은 언제든 다시 만들 수 있음)
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        self.pid = os.getpid()
+        self.conn.execute("PRAGMA journal_mode=MEMORY")
+
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != CATALOG_VERSION:
+            with self.conn:
+                self.conn.execute("DROP TABLE IF EXISTS samples")
+                self.conn.execute("DROP TABLE IF EXISTS meta")
+                self.conn.execute("PRAGMA user_version = %d" % CATALOG_VERSION)
+
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS samples ("
+            "pos INTEGER, id TEXT PRIMARY KEY, "
+            "input TEXT, input_size INTEGER, input_mtime INTEGER, input_hash TEXT, "
+            "label TEXT, label_size INTEGER, label_mtime INTEGER, label_hash TEXT)")
+        self.conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS samples_pos ON samples (pos)")
+
+    def _db(self):
+        # fork 된 worker 는 부모의 연결을 쓰면 안 되므로 프로세스마다 새로 연결
+        if self.conn is None or self.pid != os.getpid():
+            self._connect()
+        return self.conn
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['conn'] = None
+        state['pid'] = None
+        return state
+
+    def close(self):
+        if self.conn is not None and self.pid == os.getpid():
+            self.conn.close()
+            self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _meta(self, key):
+        row = self._db().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    ## 목록 갱신
+    def _scan(self):
+        # id 별 {'input': (이름, 크기, mtime), 'label': (...)}
+        found = {}
+        with os.scandir(self.data_dir) as it:
+            for entry in it:
+                name = entry.name
+                if not entry.is_file():
+                    continue
+                for kind in ('input', 'label'):
+                    if name.startswith(kind + '_') and name.endswith(('.npy', '.npz')):
+                        st = entry.stat()
+                        id = os.path.splitext(name)[0][len(kind) + 1:]
+                        found.setdefault(id, {})[kind] = (name, st.st_size, st.st_mtime_ns)
+        return found
+
+    def update(self, force=False):
+        # 디렉토리가 바뀌었으면 다시 훑어서 id 순서로 pos 를 다시 매김, 바뀐 샘플 수를 반환
+        if self.writable:
+            dir_mtime = str(os.stat(self.data_dir).st_mtime_ns)
+            if not force and self._meta('dir_mtime') == dir_mtime:
+                return 0
+            old = {row[1]: row for row in self._db().execute("SELECT * FROM samples")}
+        else:
+            old = {row[1]: row for row in self.rows or []}
+
+        found = self._scan()
+
+        rows = []
+        unpaired = []
+        changed = 0
+        for id in sorted(found):
+            files = found[id]
+            if 'input' not in files or 'label' not in files:
+                unpaired.append(id)
+                continue
+
+            prev = old.get(id)
+            row = [len(rows), id]
+            for kind, col in (('input', 2), ('label', 6)):
+                name, size, mtime = files[kind]
+                # 이름 / 크기 / mtime 이 같으면 이전 해시를 재사용
+                same = prev is not None and tuple(prev[col:col + 3]) == (name, size, mtime)
+                row += [name, size, mtime, prev[col + 3] if same else None]
+            if prev is None or tuple(prev[1:]) != tuple(row[1:]):
+                changed += 1
+            rows.append(tuple(row))
+
+        changed += len([id for id in old if id not in found or id in unpaired])
+
+        if self.writable:
+            with self._db():
+                self.conn.execute("DELETE FROM samples")
+                self.conn.executemany("INSERT INTO samples VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('dir_mtime', ?)", (dir_mtime,))
+        else:
+            self.rows = rows
+            self.pos_of = {row[1]: row[0] for row in rows}
+
+        if unpaired:
+            print("CATALOG: %d samples without input / label pair skipped (e.g. %s)" % (len(unpaired), unpaired[0]))
+
+        return changed
+
+    ## 샘플 조회
+    def __len__(self):
+        if not self.writable:
+            return len(self.rows)
+        return self._db().execute("SELECT COUNT(*) FROM samples").fetchone()[0]
+
+    def count(self):
+        return len(self)
+
+    def _row(self, key, by):
+        if not self.writable:
+            pos = key if by == 'pos' else self.pos_of.get(key)
+            return self.rows[pos] if pos is not None and 0 <= pos < len(self.rows) else None
+        return self._db().execute("SELECT * FROM samples WHERE %s = ?" % by, (key,)).fetchone()
+
+    def _verify(self, row):
+        # 제자리에서 다시 쓴 파일은 크기 / mtime 만 갱신하고 해시는 지움
+        row = list(row)
+        dirty = False
+        for col in (2, 6):
+            st = os.stat(os.path.join(self.data_dir, row[col]))
+            if (row[col + 1], row[col + 2]) != (st.st_size, st.st_mtime_ns):
+                row[col + 1:col + 4] = [st.st_size, st.st_mtime_ns, None]
+                dirty = True
+        if dirty:
+            self._store(row)
+        return row
+
+    def _store(self, row):
+        if self.writable:
+            with self._db():
+                self.conn.execute("INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+        else:
+            self.rows[row[0]] = tuple(row)
+
+    def at(self, pos):
+        # pos 번째 (id 순서) 샘플
+        row = self._row(pos, 'pos')
+        if row is None:
+            raise IndexError(pos)
+        return dict(zip(COLUMNS, self._verify(row)))
+
+    def lookup(self, id):
+        row = self._row(id, 'id')
+        if row is None:
+            return None
+        return dict(zip(COLUMNS, self._verify(row)))
+
+    def hashes(self, id):
+        # (input 해시, label 해시), 처음 부를 때나 파일이 바뀐 뒤에만 파일을 읽음
+        row = self._row(id, 'id')
+        if row is None:
+            return None
+        row = self._verify(row)
+        if row[5] is None or row[9] is None:
+            row[5] = row[5] or file_hash(os.path.join(self.data_dir, row[2]))
+            row[9] = row[9] or file_hash(os.path.join(self.data_dir, row[6]))
+            self._store(row)
+        return row[5], row[9]
@@ -1,101 +1,346 @@
 import os
+import time
 import numpy as np
-from PIL import Image
 import matplotlib.pyplot as plt
+from multiprocessing import Pool, cpu_count
+from cache import PreprocessCache, entry_exists, entry_key, entry_paths, file_signature, link_or_copy, write_entry
+from shard import ShardReader, ShardWriter, is_shard_dir, remove_shard
+from masks import LABEL_PACKED, LABEL_RAW, load_label, save_packed
+from manifest import STORE_NAME, has_manifest, make_split, manifest_path, write_manifest
+from decode import benchmark_decoders, get_decoder
+from catalog import Catalog
 
+IMG_SIZE = (512, 512)
+TILE_INDEX_NAME = 'tile_index.npy'
 
-def data_read():
+
+## 이미지/라벨 목록 만들기
+def list_pairs(img_data, labels_data):
+    # 디렉토리는 한 번씩만 읽고, 이름 순서대로 이미지와 라벨을 짝지음
+    lst_img = sorted(os.listdir(img_data))
+    lst_label = sorted(os.listdir(labels_data))
+
+    return [(os.path.join(img_data, f_img), os.path.join(labels_data, f_label))
+            for f_img, f_label in zip(lst_img, lst_label)]
+
+
+## 이미지 한 쌍 전처리하기
+def load_pair(img_path, label_path, size=IMG_SIZE, decoder='pil'):
+    # size 가 None 이면 원본 해상도 그대로 사용
+    return get_decoder(decoder).load_pair(img_path, label_path, size)
+
+
+## 원본 해상도 이미지를 겹치는 tile 로 자르기
+def tile_coords(h, w, tile_size, overlap=0):
+    # 마지막 tile 은 이미지 끝에 맞춰서 잘라 가장자리가 빠지지 않게 함
+    stride = tile_size - overlap
+    if stride <= 0:
+        raise ValueError("tile overlap must be smaller than tile size")
+
+    def starts(n):
+        if n <= tile_size:
+            return [0]
+        lst = list(range(0, n - tile_size, stride))
+        return lst + [n - tile_size]
+
+    return [(x, y) for y in starts(h) for x in starts(w)]
+
+
+def pad_to_tile(arr, tile_size, mode='edge'):
+    # tile_size 보다 작은 축은 오른쪽 / 아래쪽을 채워서 모든 tile 크기를 같게 함
+    # (input 은 가장자리 값을 늘이고, label 은 mode='constant' 로 배경 0 을 채움)
+    ph = max(tile_size - arr.shape[0], 0)
+    pw = max(tile_size - arr.shape[1], 0)
+    if ph == 0 and pw == 0:
+        return arr
+    pad = ((0, ph), (0, pw)) + ((0, 0),) * (arr.ndim - 2)
+    return np.pad(arr, pad, mode=mode)
+
+
+def cut_tiles(arr, coords, tile_size, mode='edge'):
+    arr = pad_to_tile(arr, tile_size, mode)
+    return [arr[y:y + tile_size, x:x + tile_size] for x, y in coords]
+
+
+def load_tile_index(data_dir):
+    # 샘플별 (원본 인덱스, x, y), tile 로 자르지 않은 데이터면 None
+    path = os.path.join(data_dir, TILE_INDEX_NAME)
+    if not os.path.exists(path):
+        return None
+    return np.load(path)
+
+
+## 캐시를 거쳐 이미지 한 쌍 전처리하기
+def cached_pair(img_path, label_path, cache_dir, known_img=None, known_label=None, load=True, size=IMG_SIZE,
+                decoder='pil'):
+    # 원본 해시 + 전처리 파라미터로 캐시를 찾고, 없을 때만 decode 해서 캐시에 씀
+    img_sig = file_signature(img_path, known_img)
+    label_sig = file_signature(label_path, known_label)
+    key = entry_key(img_sig, label_sig, {'size': list(size) if size is not None else None, 'decoder': decoder})
+    record = (img_path, img_sig, label_path, label_sig)
+
+    hit = entry_exists(cache_dir, key)
+    if hit:
+        cache_paths = entry_paths(cache_dir, key)
+        nbytes = 0
+        arrays = (np.load(cache_paths[0]), np.load(cache_paths[1])) if load else (None, None)
+    else:
+        arrays = load_pair(img_path, label_path, size, decoder)
+        cache_paths = write_entry(cache_dir, key, *arrays)
+        nbytes = img_sig[0] + label_sig[0]
+
+    return arrays, hit, record, cache_paths, nbytes
+
+
+def remove_samples(data_dir):
+    # 이전 실행의 input_* / label_* 파일 (다른 tile 크기나 다른 split 개수로 만든 것 포함) 을 모두 지움
+    # 캐시로 하드링크된 파일도 링크만 지워지므로 캐시 내용은 그대로 남음
+    for f in os.listdir(data_dir):
+        if f.startswith(('input_', 'label_')) and f.endswith(('.npy', '.npz')):
+            os.remove(os.path.join(data_dir, f))
+
+
+def _save_sample(dst_dir, stem, input_, label_, label_format=LABEL_RAW, cache_paths=None):
+    # input_<stem>.npy 와 label_<stem>.npy (압축 라벨이면 label_<stem>.npz) 로 저장
+    # cache_paths 가 있으면 다시 쓰지 않고 캐시 파일을 하드링크
+    dst_input = os.path.join(dst_dir, 'input_%s.npy' % stem)
+    dst_label = os.path.join(dst_dir, 'label_%s.npy' % stem)
+    dst_packed = os.path.join(dst_dir, 'label_%s.npz' % stem)
+
+    # 이전 실행에서 캐시로 하드링크된 파일이면 캐시 내용이 덮어써지지 않도록 먼저 지우고,
+    # 다른 라벨 형식으로 저장된 파일도 함께 지움
+    for dst in (dst_input, dst_label, dst_packed):
+        if os.path.exists(dst):
+            os.remove(dst)
+
+    if cache_paths is not None:
+        link_or_copy(cache_paths[0], dst_input)
+    else:
+        np.save(dst_input, input_)
+
+    if label_format == LABEL_PACKED:
+        save_packed(dst_packed, label_)
+    elif cache_paths is not None:
+        link_or_copy(cache_paths[1], dst_label)
+    else:
+        np.save(dst_label, label_)
+
+
+def _preprocess_job(job):
+    # worker 프로세스에서 decode / resize / 저장까지 처리
+    # dst_dir 가 None 이면 저장하지 않고 배열을 돌려줌 (shard 저장용)
+    img_path, label_path, dst_dir, i = job['img_path'], job['label_path'], job['dst_dir'], job['i']
+    tile_size = job['tile_size']
+    size = None if tile_size else IMG_SIZE
+
+    result = {'nbytes': 0, 'hit': False, 'record': None, 'samples': None, 'tiles': None}
+
+    # 캐시 파일을 하드링크만 하면 되는 경우가 아니면 배열을 읽어 옴
+    load = dst_dir is None or bool(tile_size) or job['label_format'] == LABEL_PACKED
+
+    if job['cache_dir'] is None:
+        input_, label_ = load_pair(img_path, label_path, size, job['decoder'])
+        result['nbytes'] = os.path.getsize(img_path) + os.path.getsize(label_path)
+    else:
+        (input_, label_), result['hit'], result['record'], cache_paths, result['nbytes'] = cached_pair(
+            img_path, label_path, job['cache_dir'], job['known_img'], job['known_label'], load=load, size=size,
+            decoder=job['decoder'])
+
+    if tile_size:
+        coords = tile_coords(input_.shape[0], input_.shape[1], tile_size, job['tile_overlap'])
+        tiles_input = cut_tiles(input_, coords, tile_size)
+        tiles_label = cut_tiles(label_, coords, tile_size, mode='constant')
+
+        if dst_dir is None:
+            result['samples'] = list(zip(tiles_input, tiles_label))
+            result['tiles'] = [(None, x, y) for x, y in coords]
+            return result
+
+        result['tiles'] = []
+        for (x, y), tile_input, tile_label in zip(coords, tiles_input, tiles_label):
+            stem = '%03d_%04d_%04d' % (i, y, x)
+            _save_sample(dst_dir, stem, tile_input, tile_label, job['label_format'])
+            result['tiles'].append((stem, x, y))
+        return result
+
+    if dst_dir is None:
+        result['samples'] = [(input_, label_)]
+        return result
+
+    _save_sample(dst_dir, '%03d' % i, input_, label_, job['label_format'],
+                 cache_paths if job['cache_dir'] is not None else None)
+
+    return result
+
+
+def _last_sample(data_dir, index=None):
+    # 확인용으로 마지막 샘플 하나 읽기
+    if is_shard_dir(data_dir):
+        reader = ShardReader(data_dir)
+        input_, label_ = reader.get(len(reader) - 1 if index is None else index)
+        return input_.squeeze(), label_.squeeze()
+
+    lst_data = os.listdir(data_dir)
+    lst_label = sorted(f for f in lst_data if f.startswith('label'))
+    lst_input = sorted(f for f in lst_data if f.startswith('input'))
+
+    return np.load(os.path.join(data_dir, lst_input[-1])), load_label(os.path.join(data_dir, lst_label[-1]))
+
+
+def data_read(num_workers=None, use_cache=True, store='npy', seed=None, tile_size=None, tile_overlap=0,
+              decoder='pil', label_format='raw', show=True):
+    # store = 'npy'      : split 디렉토리에 input_%03d.npy / label_%03d.npy 로 저장
+    # store = 'shard'    : split 마다 uint8 shard 파일 하나 + offset index 로 저장
+    # store = 'manifest' : 전체를 store/ shard 하나로 저장하고 split 은 manifest.json 의 인덱스로만 정의
+    # tile_size 를 주면 512x512 로 줄이지 않고 원본 해상도에서 tile_overlap 만큼 겹치는 tile 로 자름
+    # decoder = 'pil' / 'cv2' / 'cv2_reduced2', 'auto' 이면 benchmark 로 pil 과 결과가 같은 것 중 가장 빠른 것을 고름
+    # label_format = 'packed' 이면 라벨을 이진화해서 1 bit / 픽셀로 저장
     path = './datasets/'
 
     dir_save_train = os.path.join(path, 'train')
     dir_save_val = os.path.join(path, 'val')
     dir_save_test = os.path.join(path, 'test')
+    dir_save_store = os.path.join(path, STORE_NAME)
 
-    if not os.path.exists(dir_save_train):
-        os.makedirs(dir_save_train)
+    img_data = './datasets/Imgs/'
+    labels_data = './datasets/labels/'
 
-    if not os.path.exists(dir_save_val):
-        os.makedirs(dir_save_val)
+    lst_pair = list_pairs(img_data, labels_data)
+    nframe = len(lst_pair)
 
-    if not os.path.exists(dir_save_test):
-        os.makedirs(dir_save_test)
+    label_format = LABEL_PACKED if label_format == 'packed' else LABEL_RAW
 
-    img_data = './datasets/Imgs/'
-    labels_data = './datasets/labels/'
+    if decoder == 'auto':
+        decoder, _ = benchmark_decoders(lst_pair, None if tile_size else IMG_SIZE)
 
-    nframe = len(os.listdir(img_data))
+    # seed 를 기록해 두면 같은 split 을 다시 만들 수 있음
+    split = make_split(nframe, seed=seed)
+    print("split seed: %d" % split['seed'])
 
-    nframe_train = int(nframe * 3/4) 
-    nframe_val = int(nframe * 1/8) 
-    nframe_test = int(nframe * 1/8) 
+    # (저장 디렉토리, 원본 인덱스 목록)
+    if store == 'manifest':
+        splits = [(dir_save_store, list(range(nframe)))]
+    else:
+        splits = [(dir_save_train, split['splits']['train']),
+                  (dir_save_val, split['splits']['val']),
+                  (dir_save_test, split['splits']['test'])]
 
-    id_frame = np.arange(nframe)
-    np.random.shuffle(id_frame)
-    print(id_frame)
+    cache = PreprocessCache() if use_cache else None
+    cache_dir = cache.cache_dir if use_cache else None
 
+    jobs = []
+    job_split = []
+    for dst_dir, id_frame in splits:
+        for i, id in enumerate(id_frame):
+            img_path, label_path = lst_pair[id]
+            jobs.append({'img_path': img_path, 'label_path': label_path, 'source_id': int(id),
+                         'dst_dir': dst_dir if store == 'npy' else None, 'i': i,
+                         'cache_dir': cache_dir,
+                         'known_img': cache.known(img_path) if use_cache else None,
+                         'known_label': cache.known(label_path) if use_cache else None,
+                         'tile_size': tile_size, 'tile_overlap': tile_overlap, 'decoder': decoder,
+                         'label_format': label_format})
+            job_split.append(dst_dir)
 
-    # ##
-    offset_nframe = 0
+    writers = {}
+    tile_rows = {}
+    for dst_dir, _ in splits:
+        if not os.path.exists(dst_dir):
+            os.makedirs(dst_dir)
 
-    for i in range(nframe_train):
-        img_label = Image.open(os.path.join(labels_data, os.listdir(
-            labels_data)[id_frame[i + offset_nframe]]))
-        img_label = img_label.resize((512, 512))
-        img_input = Image.open(os.path.join(
-            img_data, os.listdir(img_data)[id_frame[i + offset_nframe]]))
-        img_input = img_input.resize((512, 512))
-        img_input = img_input.convert('L')
+        if store in ('shard', 'manifest'):
+            writers[dst_dir] = ShardWriter(dst_dir, label_format)
+        else:
+            # 이전에 만든 shard 가 남아 있으면 Dataset 이 npy 대신 shard 를 읽게 되므로 지움
+            remove_shard(dst_dir)
+            # 이전 실행의 샘플이 남아 있으면 catalog 에 새 샘플과 섞여서 들어가므로 지움
+            remove_samples(dst_dir)
 
-        label_ = np.asarray(img_label)
-        input_ = np.asarray(img_input)
+        tile_rows[dst_dir] = []
+        if os.path.exists(os.path.join(dst_dir, TILE_INDEX_NAME)):
+            os.remove(os.path.join(dst_dir, TILE_INDEX_NAME))
 
-        np.save(os.path.join(dir_save_train, 'label_%03d.npy' % i), label_)
-        np.save(os.path.join(dir_save_train, 'input_%03d.npy' % i), input_)
+    if num_workers is None:
+        num_workers = cpu_count()
 
+    nbytes = 0
+    nhit = 0
+    nsample = 0
 
-    ##
-    offset_nframe = nframe_train
+    def collect(results):
+        # shard 는 결과가 들어오는 순서대로 main 프로세스에서 이어 씀
+        nonlocal nbytes, nhit, nsample
+        for job, dst_dir, result in zip(jobs, job_split, results):
+            nbytes += result['nbytes']
+            nhit += result['hit']
+            if use_cache:
+                img_path, img_sig, label_path, label_sig = result['record']
+                cache.update(img_path, img_sig)
+                cache.update(label_path, label_sig)
+            if result['samples'] is not None:
+                for sample in result['samples']:
+                    writers[dst_dir].append(*sample)
+                nsample += len(result['samples'])
+            else:
+                nsample += len(result['tiles']) if result['tiles'] is not None else 1
+            if result['tiles'] is not None:
+                tile_rows[dst_dir] += [(name, job['source_id'], x, y) for name, x, y in result['tiles']]
 
-    for i in range(nframe_val):
-        img_label = Image.open(os.path.join(labels_data, os.listdir(
-            labels_data)[id_frame[i + offset_nframe]]))
-        img_label = img_label.resize((512, 512))
-        img_input = Image.open(os.path.join(
-            img_data, os.listdir(img_data)[id_frame[i + offset_nframe]]))
-        img_input = img_input.resize((512, 512))
-        img_input = img_input.convert('L')
+    st = time.time()
+    if num_workers > 1 and len(jobs) > 1:
+        with Pool(processes=min(num_workers, len(jobs))) as pool:
+            collect(pool.imap(_preprocess_job, jobs, chunksize=8))
+    else:
+        collect(map(_preprocess_job, jobs))
+    elapsed = max(time.time() - st, 1e-6)
 
-        label_ = np.asarray(img_label)
-        input_ = np.asarray(img_input)
+    for writer in writers.values():
+        writer.close()
 
-        np.save(os.path.join(dir_save_val, 'label_%03d.npy' % i), label_)
-        np.save(os.path.join(dir_save_val, 'input_%03d.npy' % i), input_)
+    if tile_size:
+        for dst_dir, rows in tile_rows.items():
+            # npy 는 Dataset 이 파일 이름순으로 읽으므로 같은 순서로 정렬
+            if store == 'npy':
+                rows = sorted(rows)
+            tile_index = np.array([row[1:] for row in rows], dtype=np.int64).reshape(-1, 3)
+            np.save(os.path.join(dst_dir, TILE_INDEX_NAME), tile_index)
 
-    ##
-    offset_nframe = nframe_train + nframe_val
+    if use_cache:
+        cache.save()
 
-    for i in range(nframe_test):
-        img_label = Image.open(os.path.join(labels_data, os.listdir(
-            labels_data)[id_frame[i + offset_nframe]]))
-        img_label = img_label.resize((512, 512))
-        img_input = Image.open(os.path.join(
-            img_data, os.listdir(img_data)[id_frame[i + offset_nframe]]))
-        img_input = img_input.resize((512, 512))
-        img_input = img_input.convert('L')
+    # npy 디렉토리는 Dataset 이 바로 열 수 있도록 catalog 를 미리 만들어 둠 (해시는 필요할 때 catalog.hashes 에서 구함)
+    if store == 'npy':
+        for dst_dir, _ in splits:
+            Catalog(dst_dir).close()
 
-        label_ = np.asarray(img_label)
-        input_ = np.asarray(img_input)
+    if store == 'manifest':
+        sources = [os.path.basename(img_path) for img_path, _ in lst_pair]
+        groups = [row[1] for row in tile_rows[dir_save_store]] if tile_size else None
+        manifest = write_manifest(path, split, sources, groups)
+    elif has_manifest(path):
+        # split 디렉토리를 새로 만들었으므로 이전 manifest 는 더 이상 사용하지 않음
+        os.remove(manifest_path(path))
 
-        np.save(os.path.join(dir_save_test, 'label_%03d.npy' % i), label_)
-        np.save(os.path.join(dir_save_test, 'input_%03d.npy' % i), input_)
+    print("PREPROCESS: %d pairs | %d samples | %d cached | %d workers | %.2f sec | %.1f pairs/sec | %.1f MB/sec" %
+          (len(jobs), nsample, nhit, num_workers, elapsed, len(jobs) / elapsed, nbytes / elapsed / 2**20))
 
     ##
-    plt.subplot(121)
-    plt.imshow(label_, cmap='gray')
-    plt.title('label')
+    if show:
+        if store == 'manifest':
+            if len(manifest['splits']['test']) == 0:
+                return
+            input_, label_ = _last_sample(dir_save_store, manifest['splits']['test'][-1])
+        else:
+            if len(split['splits']['test']) == 0:
+                return
+            input_, label_ = _last_sample(dir_save_test)
+
+        plt.subplot(121)
+        plt.imshow(label_, cmap='gray')
+        plt.title('label')
 
-    plt.subplot(122)
-    plt.imshow(input_, cmap='gray')
-    plt.title('input')
+        plt.subplot(122)
+        plt.imshow(input_, cmap='gray')
+        plt.title('input')
 
-    plt.show()
+        plt.show()
@@ -3,39 +3,115 @@ import numpy as np
 
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
+
+from shard import SHARD_INDEX_NAME, ShardReader, is_shard_dir
+from masks import load_label
+from manifest import has_manifest, load_manifest, make_split
+from cache import CACHE_DIR, PreprocessCache
+from sample_cache import SampleCache
+from catalog import Catalog
+from stats import build_stats_index
+from decode import get_decoder
+from torchvision import transforms
+from data_read import list_pairs, load_pair, cached_pair
+
 
 ## 데이터 로더를 구현하기
 class Dataset(torch.utils.data.Dataset):
-    def __init__(self, data_dir, transform=None):
+    def __init__(self, data_dir, transform=None, split=None, cache_bytes=0):
+        # split 을 주면 data_dir 은 datasets 최상위 디렉토리
+        # manifest.json 이 있으면 store/ 에서 manifest 인덱스로, 없으면 data_dir/split 에서 읽음
+        # cache_bytes 를 주면 그 크기만큼 decode 된 샘플을 공유 메모리에 두고 재사용
+        # 샘플은 uint8 그대로 transform 에 넘기고, float32 변환은 Normalization / ToTensor 에서 한 번만 함
+        self.id_frame = None
+        if split is not None:
+            if has_manifest(data_dir):
+                manifest = load_manifest(data_dir)
+                self.id_frame = manifest['splits'][split]
+                data_dir = os.path.join(data_dir, manifest['store'])
+            else:
+                data_dir = os.path.join(data_dir, split)
+
         self.data_dir = data_dir
         self.transform = transform
 
-        lst_data = os.listdir(self.data_dir)
-
-        lst_label = [f for f in lst_data if f.startswith('label')] # 데이터 디렉토리에 있는 리스트 불러오기
-        lst_input = [f for f in lst_data if f.startswith('input')]
-
-        lst_label.sort()
-        lst_input.sort()
+        # data_read(store='shard') 로 만든 디렉토리면 shard 를 memmap 으로 읽음
+        self.shard = ShardReader(self.data_dir) if is_shard_dir(self.data_dir) else None
+        # 아니면 catalog.sqlite 에서 id 로 짝지은 input / label 을 샘플마다 조회 (디렉토리가 바뀐 경우에만 다시 훑음)
+        self.catalog = Catalog(self.data_dir) if self.shard is None else None
 
-        self.lst_label = lst_label
-        self.lst_input = lst_input
+        # 첫 샘플 크기로 slot 크기를 정함
+        self.cache = None
+        if cache_bytes > 0 and len(self) > 0:
+            input, label = self.load_raw(0)
+            self.cache = SampleCache(cache_bytes, len(self), input.shape, label.shape)
 
     def __len__(self):
-        return len(self.lst_label)
-
-    def __getitem__(self, index):  # train 할 때 
-        label = np.load(os.path.join(self.data_dir, self.lst_label[index]))
-        input = np.load(os.path.join(self.data_dir, self.lst_input[index]))
-
-        label = label/255.0
-        input = input/255.0
+        if self.id_frame is not None:
+            return len(self.id_frame)
+        if self.shard is not None:
+            return len(self.shard)
+        return len(self.catalog)
+
+    ## 저장된 샘플 단위 접근 (manifest 로 나눈 경우 store 전체 기준 번호)
+    def num_stored(self):
+        if self.shard is not None:
+            return len(self.shard)
+        return len(self.catalog)
+
+    def storage_id(self, index):
+        if self.id_frame is not None:
+            return self.id_frame[index]
+        return index
+
+    def read_stored(self, sid):
+        # 저장된 uint8 (input, label) 그대로 읽기
+        if self.shard is not None:
+            return self.shard.get(sid)
+
+        row = self.catalog.at(sid)
+        label = load_label(os.path.join(self.data_dir, row['label']))
+        input = np.load(os.path.join(self.data_dir, row['input']))
+
+        return input, label
+
+    def sample_key(self, sid):
+        # 저장된 샘플 하나의 내용을 나타내는 값 (stats index 를 샘플 단위로 갱신할 때 사용)
+        # shard 는 저장할 때 구한 crc32, npy 는 catalog 의 파일 해시 (크기 / mtime 이 바뀐 파일만 다시 해시)
+        if self.shard is not None:
+            crc = self.shard.checksum(sid)
+            if crc is not None:
+                return 'crc %d %s' % (crc, ' '.join(str(v) for v in self.shard.index[sid][1:8]))
+            # checksum 이 없는 예전 shard 는 index 파일이 바뀌면 전부 다시 계산
+            st = os.stat(os.path.join(self.data_dir, SHARD_INDEX_NAME))
+            return '%d %d %d' % (st.st_size, st.st_mtime_ns, sid)
+
+        return 'sha1 %s %s' % self.catalog.hashes(self.catalog.at(sid)['id'])
+
+    def load_raw(self, index):
+        return self.read_stored(self.storage_id(index))
+
+    def get_raw(self, index):
+        # 캐시를 거쳐 uint8 HWC (input, label) 읽기
+        cached = self.cache.get(index) if self.cache is not None else None
+        if cached is not None:
+            input, label = cached
+        else:
+            input, label = self.load_raw(index)
+            if self.cache is not None:
+                self.cache.put(index, input, label)
 
         if label.ndim == 2:
             label = label[:, :, np.newaxis]
         if input.ndim == 2:
             input = input[:, :, np.newaxis]
 
+        return input, label
+
+    def __getitem__(self, index):  # train 할 때 
+        input, label = self.get_raw(index)
+
         data = {'input': input, 'label': label}
 
         if self.transform:
@@ -46,8 +122,6 @@ class Dataset(torch.utils.data.Dataset):
     # def __getitem__(self, index): # test 할 때
     #     input = np.load(os.path.join(self.data_dir, self.lst_input[index]))
 
-    #     input = input/255.0
-
     #     if input.ndim == 2:
     #         input = input[:, :, np.newaxis]
 
@@ -59,13 +133,208 @@ class Dataset(torch.utils.data.Dataset):
     #     return data    
 
 
+## 불량 주변을 우선해서 patch 를 뽑는 데이터 로더
+class PatchDataset(torch.utils.data.Dataset):
+    # 이미지 한 장을 한 번만 읽어서 patch_size 크기 patch 를 patches_per_image 개씩 뽑음
+    # 샘플 하나가 patch dict 의 list 이므로 collate_fn 으로 BatchCollate 를 써서 펼쳐야 함
+    # (batch_size 는 이미지 수, 실제 batch 는 batch_size * patches_per_image 개의 patch)
+    # fg_prob 확률로 불량 픽셀 하나가 patch 안에 들어오도록 뽑고, 나머지는 이미지 전체에서 무작위로 뽑음
+    def __init__(self, dataset, patch_size=128, patches_per_image=8, fg_prob=0.5, transform=None, seed=None):
+        self.dataset = dataset
+        self.patch_size = patch_size
+        self.patches_per_image = patches_per_image
+        self.fg_prob = fg_prob
+        self.transform = transform
+        self.rng = np.random.default_rng(seed)
+
+        stats = build_stats_index(dataset)
+        self.offsets, self.points = stats['offsets'], stats['points']
+
+    def reseed(self, seed):
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def _corner(self, h, w, pts):
+        ps = self.patch_size
+        if len(pts) > 0 and self.rng.random() < self.fg_prob:
+            # 불량 픽셀이 patch 안 임의의 위치에 오도록 좌상단을 정함
+            y, x = pts[self.rng.integers(len(pts))]
+            top = y - self.rng.integers(ps)
+            left = x - self.rng.integers(ps)
+        else:
+            top = self.rng.integers(max(h - ps, 0) + 1)
+            left = self.rng.integers(max(w - ps, 0) + 1)
+
+        top = int(np.clip(top, 0, max(h - ps, 0)))
+        left = int(np.clip(left, 0, max(w - ps, 0)))
+
+        return top, left
+
+    def __getitem__(self, index):
+        sid = self.dataset.storage_id(index)
+
+        input, label = self.dataset.get_raw(index)
+        pts = self.points[self.offsets[sid]:self.offsets[sid + 1]]
+        ps = self.patch_size
+
+        patches = []
+        for _ in range(self.patches_per_image):
+            top, left = self._corner(input.shape[0], input.shape[1], pts)
+
+            # 복사 없이 view 로 자름
+            data = {'input': input[top:top + ps, left:left + ps], 'label': label[top:top + ps, left:left + ps]}
+
+            if self.transform:
+                data = self.transform(data)
+
+            patches.append(data)
+
+        return patches
+
+
+## 원본 이미지를 바로 읽는 스트리밍 데이터 로더
+class StreamDataset(torch.utils.data.IterableDataset):
+    # data_read 없이 datasets/Imgs, datasets/labels 를 DataLoader worker 에서 바로 decode / resize 함
+    # split 은 manifest.json 이 있으면 그 인덱스를, 없으면 seed 로 만든 인덱스를 사용하므로
+    # train / val 에는 같은 seed 를 넘겨야 함
+    def __init__(self, data_dir, split='train', transform=None, seed=0, shuffle=True, use_cache=True,
+                 decoder='pil'):
+        self.transform = transform
+        self.decoder = decoder
+        self.shuffle = shuffle
+        self.cache_dir = CACHE_DIR if use_cache else None
+        # persistent worker 는 dataset 복사본을 계속 들고 있으므로 epoch 는 공유 메모리에 두고 set_epoch 으로 바꿈
+        self.epoch = torch.zeros(1, dtype=torch.int64).share_memory_()
+
+        self.lst_pair = list_pairs(os.path.join(data_dir, 'Imgs'), os.path.join(data_dir, 'labels'))
+
+        if has_manifest(data_dir):
+            manifest = load_manifest(data_dir)
+        else:
+            manifest = make_split(len(self.lst_pair), seed=seed)
+        self.seed = manifest['seed']
+        # tile 로 자른 manifest 라도 원본 단위 split 을 사용
+        self.id_frame = manifest.get('source_splits', manifest['splits'])[split]
+
+        # 캐시 index 는 읽기 전용으로 들고 있다가 worker 가 끝날 때 새 기록만 합쳐서 저장
+        self.known = PreprocessCache(self.cache_dir).files if use_cache else {}
+
+    def __len__(self):
+        return len(self.id_frame)
+
+    def set_epoch(self, epoch):
+        # DataLoader worker 를 쓸 때는 epoch 마다 불러야 순서가 바뀜 (worker 없이 읽으면 알아서 바뀜)
+        self.epoch[0] = epoch
+
+    def _load(self, id):
+        img_path, label_path = self.lst_pair[id]
+
+        if self.cache_dir is None:
+            return load_pair(img_path, label_path, decoder=self.decoder), None
+
+        # 처음 읽는 이미지는 캐시에 써 두고, 다음 epoch 부터는 캐시 npy 를 읽음
+        arrays, hit, record, _, _ = cached_pair(
+            img_path, label_path, self.cache_dir,
+            self.known.get(os.path.abspath(img_path)), self.known.get(os.path.abspath(label_path)),
+            decoder=self.decoder)
+
+        return arrays, None if hit else record
+
+    def __iter__(self):
+        id_frame = np.array(self.id_frame)
+        worker_info = torch.utils.data.get_worker_info()
+
+        if self.shuffle:
+            # worker 들은 같은 순서로 섞은 뒤 나눠 가져야 하므로 모든 worker 가 같은 (seed, epoch) 사용
+            id_frame = np.random.default_rng((self.seed, int(self.epoch[0]))).permutation(id_frame)
+        if worker_info is None:
+            self.epoch += 1
+
+        # worker 마다 겹치지 않게 나눠서 처리
+        if worker_info is not None:
+            id_frame = id_frame[worker_info.id::worker_info.num_workers]
+
+        records = []
+        for id in id_frame:
+            (input, label), record = self._load(id)
+            if record is not None:
+                records.append(record)
+
+            if label.ndim == 2:
+                label = label[:, :, np.newaxis]
+            if input.ndim == 2:
+                input = input[:, :, np.newaxis]
+
+            data = {'input': input, 'label': label}
+
+            if self.transform:
+                data = self.transform(data)
+
+            yield data
+
+        if records:
+            cache = PreprocessCache(self.cache_dir)
+            for img_path, img_sig, label_path, label_sig in records:
+                cache.update(img_path, img_sig)
+                cache.update(label_path, label_sig)
+            cache.save()
+
+
+## 라벨 없는 이미지 폴더를 읽는 추론용 데이터 로더
+class InferenceDataset(torch.utils.data.Dataset):
+    # test/ 처럼 라벨이 없는 폴더의 이미지 (png / jpg 등, 크기 무관) 를 __getitem__ 에서 그때그때 decode 함
+    # size 를 주면 그 크기로 resize, 주지 않으면 원본 해상도에서 UNet 이 받을 수 있도록 pad_multiple 배수로 pad
+    # (pad_multiple 은 UNet.pad_multiple = 2 ** (depth - 1), 기본 32 는 depth=6 인 기본 UNet 기준)
+    # 원본 해상도의 크기가 서로 다르면 batch_size=1 로 읽어야 함
+    IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+
+    def __init__(self, data_dir, size=None, decoder='pil', mean=0.5, std=0.5, pad_multiple=32):
+        self.data_dir = data_dir
+        self.size = size
+        self.decoder = get_decoder(decoder)
+        self.pad_multiple = pad_multiple
+
+        self.lst_input = sorted(f for f in os.listdir(data_dir) if f.lower().endswith(self.IMAGE_EXTS))
+
+        # Normalization 과 같은 lookup table
+        self.lut = ((np.arange(256) / 255.0 - mean) / std).astype(np.float32)
+
+    def __len__(self):
+        return len(self.lst_input)
+
+    def __getitem__(self, index):
+        input = self.decoder.load_image(os.path.join(self.data_dir, self.lst_input[index]), self.size)
+        h, w = input.shape[:2]
+
+        # 오른쪽 / 아래쪽만 pad 하므로 결과에서 [:h, :w] 로 잘라내면 원본 위치와 같음
+        m = self.pad_multiple
+        ph, pw = -h % m, -w % m
+        if ph or pw:
+            input = np.pad(input, ((0, ph), (0, pw)), mode='reflect' if ph < h and pw < w else 'edge')
+
+        input = torch.from_numpy(self.lut[input][np.newaxis])
+
+        return {'input': input, 'name': self.lst_input[index], 'shape': torch.tensor([h, w])}
+
+
 ## 트렌스폼 구현하기
+# Dataset 은 uint8 샘플을 넘기고, float32 로는 Normalization(input) / ToTensor(label) 에서 한 번만 바꿈
+
+def to_float32(x):
+    # uint8 이면 255 로 나누면서 바로 float32 로 만듦
+    if x.dtype == np.uint8:
+        return np.multiply(x, np.float32(1.0 / 255.0), dtype=np.float32)
+    return x.astype(np.float32, copy=False)
+
 class ToTensor(object):
     def __call__(self, data):
         label, input = data['label'], data['input']
 
-        label = label.transpose((2, 0, 1)).astype(np.float32)
-        input = input.transpose((2, 0, 1)).astype(np.float32)
+        # C=1 인 HWC -> CHW transpose 는 메모리 순서가 같아서 복사가 일어나지 않음
+        label = np.ascontiguousarray(to_float32(label).transpose((2, 0, 1)))
+        input = np.ascontiguousarray(to_float32(input).transpose((2, 0, 1)))
 
         data = {'label': torch.from_numpy(label), 'input': torch.from_numpy(input)}
 
@@ -76,24 +345,38 @@ class Normalization(object):
         self.mean = mean
         self.std = std
 
+        # uint8 값 256 개에 대한 (x / 255 - mean) / std 를 미리 계산해 두고 한 번에 조회
+        self.lut = ((np.arange(256) / 255.0 - mean) / std).astype(np.float32)
+
     def __call__(self, data):
         label, input = data['label'], data['input']
 
-        input = (input - self.mean) / self.std
+        if input.dtype == np.uint8:
+            input = self.lut[input]
+        else:
+            input = (input - self.mean) / self.std
 
         data = {'label': label, 'input': input}
 
         return data
 
 class RandomFlip(object):
+    # uint8 상태에서 view 만 바꾸도록 Normalization 보다 앞에 두는 것이 좋음
+    # 전역 np.random 대신 자기 RNG 를 쓰고, DataLoader worker 마다 seed_worker 에서 다시 seed 함
+    def __init__(self, seed=None):
+        self.rng = np.random.default_rng(seed)
+
+    def reseed(self, seed):
+        self.rng = np.random.default_rng(seed)
+
     def __call__(self, data):
         label, input = data['label'], data['input']
 
-        if np.random.rand() > 0.5:
+        if self.rng.random() > 0.5:
             label = np.fliplr(label)
             input = np.fliplr(input)
 
-        if np.random.rand() > 0.5:
+        if self.rng.random() > 0.5:
             label = np.flipud(label)
             input = np.flipud(input)
 
@@ -101,3 +384,208 @@ class RandomFlip(object):
 
         return data
 
+
+## DataLoader 설정하기
+def seed_worker(worker_id):
+    # DataLoader 는 worker 마다 다른 torch seed 를 주므로 그 값으로 numpy 와 augmentation RNG 를 초기화
+    # (fork 된 worker 들이 같은 np.random 상태를 물려받아 똑같이 flip 하는 문제 방지)
+    seed = torch.initial_seed() % 2**32
+    np.random.seed(seed)
+
+    worker_info = torch.utils.data.get_worker_info()
+    if hasattr(worker_info.dataset, 'reseed'):
+        worker_info.dataset.reseed(seed)
+
+    transform = getattr(worker_info.dataset, 'transform', None)
+    for t in getattr(transform, 'transforms', [transform]):
+        if hasattr(t, 'reseed'):
+            t.reseed(seed)
+
+
+def loader_config(num_workers=0, pin_memory=None, persistent_workers=True, prefetch_factor=2):
+    # DataLoader 에 넘길 공통 인자
+    # pin_memory 를 정하지 않으면 GPU 가 있을 때만 사용
+    if pin_memory is None:
+        pin_memory = torch.cuda.is_available()
+
+    config = {'num_workers': num_workers, 'pin_memory': pin_memory}
+
+    # worker 를 쓸 때만 의미가 있는 인자
+    if num_workers > 0:
+        config['worker_init_fn'] = seed_worker
+        config['persistent_workers'] = persistent_workers
+        config['prefetch_factor'] = prefetch_factor
+
+    return config
+
+
+## batch 단위 트렌스폼 구현하기
+# collate 된 (N, C, H, W) tensor 에 batch 전체를 한 번에 적용
+
+class ToTensorUint8(object):
+    # 샘플 단위에서는 uint8 HWC -> CHW tensor 변환만 하고 나머지는 batch 에서 처리
+    def __call__(self, data):
+        label, input = data['label'], data['input']
+
+        label = np.ascontiguousarray(label.transpose((2, 0, 1)), dtype=np.uint8)
+        input = np.ascontiguousarray(input.transpose((2, 0, 1)), dtype=np.uint8)
+
+        data = {'label': torch.from_numpy(label), 'input': torch.from_numpy(input)}
+
+        return data
+
+class BatchRandomFlip(object):
+    # 샘플마다 따로 뒤집을지 정하고, 뒤집을 샘플만 모아서 한 번에 flip
+    # 1 byte 인 uint8 상태에서 적용하는 것이 가장 싸다
+    def __call__(self, data):
+        label, input = data['label'], data['input']
+
+        for dim in (3, 2):
+            flip = (torch.rand(input.shape[0]) > 0.5).nonzero().squeeze(1)
+            if len(flip) > 0:
+                label[flip] = label[flip].flip(dim)
+                input[flip] = input[flip].flip(dim)
+
+        data = {'label': label, 'input': input}
+
+        return data
+
+class BatchNormalization(object):
+    # uint8 -> float32 변환, 255 로 나누기, (x - mean) / std 를 곱셈 / 뺄셈 한 번씩으로 처리
+    def __init__(self, mean=0.5, std=0.5):
+        self.mean = mean
+        self.std = std
+
+    def __call__(self, data):
+        label, input = data['label'], data['input']
+
+        input = input.to(torch.float32).mul_(1.0 / (255.0 * self.std)).sub_(self.mean / self.std)
+        label = label.to(torch.float32).mul_(1.0 / 255.0)
+
+        data = {'label': label, 'input': input}
+
+        return data
+
+class BatchRandomRot90(object):
+    # 샘플마다 0 / 90 / 180 / 270 도 중 하나로 돌리고, 같은 각도끼리 모아서 한 번에 회전
+    # 정사각형이 아니면 batch 크기가 유지되도록 0 / 180 도만 사용
+    def __call__(self, data):
+        label, input = data['label'], data['input']
+
+        square = input.shape[2] == input.shape[3]
+        k = torch.randint(4, (input.shape[0],)) if square else torch.randint(2, (input.shape[0],)) * 2
+
+        for r in (1, 2, 3):
+            idx = (k == r).nonzero().squeeze(1)
+            if len(idx) > 0:
+                label[idx] = torch.rot90(label[idx], r, (2, 3))
+                input[idx] = torch.rot90(input[idx], r, (2, 3))
+
+        data = {'label': label, 'input': input}
+
+        return data
+
+class BatchRandomAffine(object):
+    # p 확률로 뽑힌 샘플에만 작은 회전 / 확대 / 이동을 한 번의 grid_sample 로 적용
+    # float tensor 가 필요하므로 BatchNormalization 다음에 둠
+    # input 은 bilinear, label 은 nearest 로 같은 grid 를 써서 0/1 mask 를 유지
+    def __init__(self, degrees=10, scale=0.1, translate=0.05, p=0.5):
+        self.degrees = degrees
+        self.scale = scale
+        self.translate = translate
+        self.p = p
+
+    def __call__(self, data):
+        label, input = data['label'], data['input']
+
+        idx = (torch.rand(input.shape[0]) < self.p).nonzero().squeeze(1)
+        if len(idx) == 0:
+            return data
+
+        n = len(idx)
+        angle = (torch.rand(n) * 2 - 1) * (self.degrees * np.pi / 180)
+        scale = 1 + (torch.rand(n) * 2 - 1) * self.scale
+        shift = (torch.rand(n, 2) * 2 - 1) * (self.translate * 2)  # grid 좌표는 -1 ~ 1
+
+        cos, sin = torch.cos(angle) / scale, torch.sin(angle) / scale
+        theta = torch.stack([torch.stack([cos, -sin, shift[:, 0]], 1),
+                             torch.stack([sin, cos, shift[:, 1]], 1)], 1).to(input.dtype)
+
+        grid = F.affine_grid(theta, (n,) + tuple(input.shape[1:]), align_corners=False)
+        input[idx] = F.grid_sample(input[idx], grid, mode='bilinear', padding_mode='reflection',
+                                   align_corners=False)
+        label[idx] = F.grid_sample(label[idx], grid, mode='nearest', padding_mode='reflection',
+                                   align_corners=False)
+
+        data = {'label': label, 'input': input}
+
+        return data
+
+class BatchBrightnessContrast(object):
+    # 정규화된 input 에 샘플별 밝기 / 대비를 적용 (label 은 그대로)
+    # brightness 는 0 ~ 1 픽셀 값 기준이므로 std 로 나눠서 정규화된 값에 더함
+    def __init__(self, brightness=0.1, contrast=0.1, std=0.5):
+        self.brightness = brightness
+        self.contrast = contrast
+        self.std = std
+
+    def __call__(self, data):
+        input = data['input']
+        n = input.shape[0]
+
+        b = ((torch.rand(n, 1, 1, 1) * 2 - 1) * (self.brightness / self.std)).to(input.dtype)
+        c = (1 + (torch.rand(n, 1, 1, 1) * 2 - 1) * self.contrast).to(input.dtype)
+        mean = input.mean(dim=(1, 2, 3), keepdim=True)
+
+        # (x - mean) * c + mean + b
+        input = input.sub_(mean).mul_(c).add_(mean + b)
+
+        data = {'label': data['label'], 'input': input}
+
+        return data
+
+class BatchGaussianNoise(object):
+    # 샘플마다 0 ~ sigma 사이 세기의 gaussian noise 를 input 에 더함 (sigma 는 0 ~ 1 픽셀 값 기준)
+    def __init__(self, sigma=0.03, std=0.5):
+        self.sigma = sigma
+        self.std = std
+
+    def __call__(self, data):
+        input = data['input']
+
+        s = (torch.rand(input.shape[0], 1, 1, 1) * (self.sigma / self.std)).to(input.dtype)
+        input = input.add_(torch.randn_like(input).mul_(s))
+
+        data = {'label': data['label'], 'input': input}
+
+        return data
+
+def batch_augmentation(mean=0.5, std=0.5, degrees=10, scale=0.1, translate=0.05, affine_p=0.5,
+                       brightness=0.1, contrast=0.1, noise=0.03):
+    # BatchCollate 에 넘길 학습용 batch transform
+    # 값을 바꾸지 않는 flip / rot90 은 1 byte 인 uint8 에서, 보간이 필요한 affine 과 밝기 / noise 는 float32 에서 적용
+    return transforms.Compose([
+        BatchRandomFlip(),
+        BatchRandomRot90(),
+        BatchNormalization(mean=mean, std=std),
+        BatchRandomAffine(degrees=degrees, scale=scale, translate=translate, p=affine_p),
+        BatchBrightnessContrast(brightness=brightness, contrast=contrast, std=std),
+        BatchGaussianNoise(sigma=noise, std=std),
+    ])
+
+class BatchCollate(object):
+    # DataLoader 의 collate_fn 으로 사용해서 batch transform 도 worker 에서 실행
+    def __init__(self, transform=None):
+        self.transform = transform
+
+    def __call__(self, batch):
+        # PatchDataset 처럼 샘플 하나가 여러 샘플의 list 이면 펼쳐서 묶음
+        if isinstance(batch[0], list):
+            batch = [data for sample in batch for data in sample]
+
+        data = torch.utils.data.dataloader.default_collate(batch)
+
+        if self.transform:
+            data = self.transform(data)
+
+        return data
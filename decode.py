@@ -0,0 +1,144 @@
+import os
+import time
+import numpy as np
+import cv2
+from PIL import Image
+
+
+## 이미지 decode backend
+class PILDecoder(object):
+    name = 'pil'
+
+    def load_pair(self, img_path, label_path, size=None):
+        # size 가 None 이면 원본 해상도 그대로 사용
+        img_label = Image.open(label_path)
+        if size is not None:
+            img_label = img_label.resize(size)
+        img_input = Image.open(img_path)
+        if size is not None:
+            img_input = img_input.resize(size)
+        img_input = img_input.convert('L')
+
+        label_ = np.asarray(img_label)
+        input_ = np.asarray(img_input)
+
+        return input_, label_
+
+    def load_image(self, img_path, size=None):
+        # 라벨 없이 흑백 입력 이미지 하나만 읽기
+        img_input = Image.open(img_path)
+        if size is not None:
+            img_input = img_input.resize(size)
+        return np.asarray(img_input.convert('L'))
+
+
+class OpenCVDecoder(object):
+    # decode 할 때 바로 흑백으로 읽어서 convert('L') 단계를 없앰
+    name = 'cv2'
+    flag = cv2.IMREAD_GRAYSCALE
+
+    def imread(self, path, flag):
+        # 한글 경로에서도 읽을 수 있도록 imread 대신 imdecode 사용
+        return cv2.imdecode(np.fromfile(path, dtype=np.uint8), flag)
+
+    def resize(self, img, size):
+        if size is None or (img.shape[1], img.shape[0]) == tuple(size):
+            return img
+        return cv2.resize(img, tuple(size), interpolation=cv2.INTER_AREA)
+
+    def flag_for(self, path, size):
+        return cv2.IMREAD_GRAYSCALE
+
+    def load_pair(self, img_path, label_path, size=None):
+        label_ = self.resize(self.imread(label_path, self.flag_for(label_path, size)), size)
+        input_ = self.resize(self.imread(img_path, self.flag_for(img_path, size)), size)
+
+        return input_, label_
+
+    def load_image(self, img_path, size=None):
+        return self.resize(self.imread(img_path, self.flag_for(img_path, size)), size)
+
+
+def image_size(path):
+    # 헤더만 읽어서 (가로, 세로) 를 구함 (PIL 은 open 할 때 픽셀을 decode 하지 않음)
+    with Image.open(path) as img:
+        return img.size
+
+
+class OpenCVReducedDecoder(OpenCVDecoder):
+    # decode 단계에서 1/2 로 줄여 읽고 (JPEG 는 DCT 단계에서 줄어들어 특히 빠름),
+    # 목표 크기와 다를 때만 한 번 더 resize
+    # 원본이 목표 크기의 2 배보다 작으면 줄여 읽은 뒤 다시 키우게 되므로 줄이지 않고 cv2 와 같게 읽음
+    # 원본 해상도가 필요한 경우(size=None)에도 줄이지 않음
+    name = 'cv2_reduced2'
+    flag = cv2.IMREAD_REDUCED_GRAYSCALE_2
+
+    def flag_for(self, path, size):
+        if size is None:
+            return cv2.IMREAD_GRAYSCALE
+        w, h = image_size(path)
+        if w >= 2 * size[0] and h >= 2 * size[1]:
+            return self.flag
+        return cv2.IMREAD_GRAYSCALE
+
+
+DECODERS = {d.name: d for d in (PILDecoder(), OpenCVDecoder(), OpenCVReducedDecoder())}
+
+
+def get_decoder(name='pil'):
+    if name not in DECODERS:
+        raise ValueError("unknown decoder: %s (choose from %s)" % (name, ', '.join(DECODERS)))
+    return DECODERS[name]
+
+
+## 현재 PC 에서 가장 빠른 decoder 고르기
+def _plane(arr):
+    return arr.reshape(arr.shape[0], arr.shape[1], -1)[:, :, 0]
+
+
+def benchmark_decoders(lst_pair, size=(512, 512), num_pairs=8, repeat=2, reference='pil', max_diff=1.0,
+                       verbose=True):
+    # decoder 마다 결과가 조금씩 다르므로 reference (기본 decoder) 와의 평균 밝기 차이를 같이 재고,
+    # 차이가 max_diff 이하인 decoder 중에서만 가장 빠른 것을 고름 (학습 데이터가 몰래 바뀌지 않게 함)
+    lst_pair = lst_pair[:num_pairs]
+    timings = {}
+    diffs = {}
+
+    ref = [DECODERS[reference].load_pair(img_path, label_path, size) for img_path, label_path in lst_pair]
+
+    for name, decoder in DECODERS.items():
+        # 첫 번째는 파일 시스템 캐시를 데우는 용도로 버림
+        for img_path, label_path in lst_pair[:1]:
+            decoder.load_pair(img_path, label_path, size)
+
+        st = time.time()
+        for _ in range(repeat):
+            for img_path, label_path in lst_pair:
+                decoder.load_pair(img_path, label_path, size)
+        timings[name] = (time.time() - st) / max(repeat * len(lst_pair), 1)
+
+        diffs[name] = 0.0
+        for (img_path, label_path), (ref_input, ref_label) in zip(lst_pair, ref):
+            input_, label_ = decoder.load_pair(img_path, label_path, size)
+            # 컬러 라벨은 PIL 이 채널을 남기고 cv2 는 흑백으로 읽으므로 첫 채널끼리 비교
+            pairs = [(input_, ref_input), (_plane(label_), _plane(ref_label))]
+            if any(a.shape != b.shape for a, b in pairs):
+                diffs[name] = float('inf')
+                break
+            for a, b in pairs:
+                diffs[name] = max(diffs[name], float(np.abs(a.astype(np.float32) - b).mean()))
+
+        if verbose:
+            print("DECODER %-14s | %.2f ms/pair | mean diff vs %s %.2f" %
+                  (name, timings[name] * 1000, reference, diffs[name]))
+
+    fastest = min((name for name in timings if diffs[name] <= max_diff), key=timings.get)
+    if verbose:
+        print("fastest decoder: %s" % fastest)
+
+    return fastest, timings
+
+
+if __name__ == '__main__':
+    from data_read import list_pairs
+    benchmark_decoders(list_pairs('./datasets/Imgs/', './datasets/labels/'))
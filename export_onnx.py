@@ -0,0 +1,61 @@
+import os
+
+import torch
+import torch.nn as nn
+
+from model import fuse_unet
+from util import load_net, is_fresh
+
+
+def onnx_path(ckpt_path):
+    # checkpoint 옆에 <checkpoint 이름>.onnx 로 저장
+    return os.path.splitext(ckpt_path)[0] + '.onnx'
+
+
+## util.save / util.best_save 로 저장한 checkpoint 를 ONNX 로 내보내기
+def export_onnx(ckpt_path, out_path=None, opset=17, shape=(1, 1, 512, 512)):
+    # Conv + BatchNorm 을 합친 eval 전용 모델을 내보내고, batch / 높이 / 너비는 dynamic 으로 둠
+    # (높이 / 너비는 UNet 의 pooling 단계만큼 2 의 배수여야 함)
+    if out_path is None:
+        out_path = onnx_path(ckpt_path)
+
+    net = fuse_unet(load_net(ckpt_path).eval())
+
+    dynamic_axes = {'input': {0: 'batch', 2: 'height', 3: 'width'},
+                    'output': {0: 'batch', 2: 'height', 3: 'width'}}
+
+    with torch.no_grad():
+        torch.onnx.export(net, torch.randn(shape), out_path, opset_version=opset,
+                          input_names=['input'], output_names=['output'], dynamic_axes=dynamic_axes)
+
+    print("ONNX model: %s" % out_path)
+
+    return out_path
+
+
+class OnnxModule(nn.Module):
+    # test / compare / infer 에서 torch 모델처럼 쓸 수 있도록 OnnxRunner 를 감쌈
+    # (onnxruntime 은 이 backend 를 쓸 때만 필요)
+    def __init__(self, path, num_threads=None):
+        super(OnnxModule, self).__init__()
+        from ort_runner import OnnxRunner
+        self.runner = OnnxRunner(path, num_threads=num_threads)
+
+    def forward(self, x):
+        output = self.runner(x.detach().cpu().numpy())
+        return torch.from_numpy(output).to(x.device)
+
+
+def load_onnx(ckpt_path, num_threads=None):
+    # 내보낸 .onnx 가 checkpoint 보다 새것이면 그대로 쓰고, 아니면 다시 내보냄
+    path = onnx_path(ckpt_path)
+    if not is_fresh(path, ckpt_path):
+        export_onnx(ckpt_path, path)
+
+    return OnnxModule(path, num_threads=num_threads)
+
+
+if __name__ == '__main__':
+    import sys
+    for path in sys.argv[1:]:
+        export_onnx(path)
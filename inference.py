@@ -0,0 +1,203 @@
+import os
+import time
+import contextlib
+import numpy as np
+
+import torch
+import torch.nn as nn
+
+from model import fuse_unet
+from util import load_net, is_fresh
+from iou import iou_numpy
+
+BACKENDS = ('eager', 'fused', 'script', 'compile', 'int8', 'onnx')
+
+
+class ChannelsLast(nn.Module):
+    # 입력을 channels_last (NHWC) 메모리 순서로 바꿔서 CPU 에서 oneDNN 의 NHWC conv kernel 을 쓰게 함
+    def __init__(self, net):
+        super(ChannelsLast, self).__init__()
+        self.net = net.to(memory_format=torch.channels_last)
+
+    def forward(self, x):
+        x = x.contiguous(memory_format=torch.channels_last)
+        return self.net(x).contiguous()
+
+
+def artifact_path(ckpt_path, backend, device, shape=None):
+    # checkpoint 옆에 <checkpoint 이름>_<backend>_<device>[_<입력 shape>].pt 로 저장
+    # trace 한 입력 shape 가 다르면 다른 파일이 되도록 shape 도 이름에 넣음
+    path = '%s_%s_%s' % (os.path.splitext(ckpt_path)[0], backend, device.type)
+    if shape is not None:
+        path += '_' + 'x'.join(str(d) for d in shape)
+    return path + '.pt'
+
+
+def _script(net, ckpt_path, example_shape):
+    # fused 모델을 channels_last 로 trace / freeze 해서 checkpoint 옆에 저장해 두고,
+    # checkpoint 보다 새 파일이 있으면 다시 trace 하지 않고 읽음
+    device = next(net.parameters()).device
+    path = artifact_path(ckpt_path, 'script', device, example_shape) if ckpt_path else None
+
+    if path and is_fresh(path, ckpt_path):
+        return torch.jit.load(path, map_location=device)
+
+    model = ChannelsLast(fuse_unet(net)).eval()
+    with torch.no_grad():
+        traced = torch.jit.trace(model, torch.randn(example_shape, device=device))
+        traced = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+
+    if path:
+        torch.jit.save(traced, path)
+
+    return traced
+
+
+@contextlib.contextmanager
+def _inductor_cache(cache_dir):
+    # 이 안에서 compile 하는 동안만 inductor 캐시 디렉토리를 cache_dir 로 바꾸고 FX graph 캐시를 켬
+    if cache_dir is None:
+        yield
+        return
+
+    import torch._inductor.config as inductor_config
+
+    prev = os.environ.get('TORCHINDUCTOR_CACHE_DIR')
+    os.environ['TORCHINDUCTOR_CACHE_DIR'] = cache_dir
+    try:
+        with inductor_config.patch(fx_graph_cache=True):
+            yield
+    finally:
+        if prev is None:
+            del os.environ['TORCHINDUCTOR_CACHE_DIR']
+        else:
+            os.environ['TORCHINDUCTOR_CACHE_DIR'] = prev
+
+
+class CompiledModule(nn.Module):
+    # torch.compile 은 처음 부를 때 compile 하므로, 만들 때 example_shape 입력으로 한 번 불러서 바로 compile 함
+    # compile 하는 동안에만 이 모델의 캐시 디렉토리를 쓰므로 compare 모드처럼 모델이 여러 개여도 각자 checkpoint 옆 캐시를 쓰고,
+    # forward 에서는 환경 변수 / 설정을 건드리지 않음
+    # 입력 크기가 고정이면 dynamic=False 가 더 빠름 (크기가 제각각인 원본 해상도 추론만 dynamic=True)
+    def __init__(self, net, cache_dir=None, example_shape=(1, 1, 512, 512), dynamic=False):
+        super(CompiledModule, self).__init__()
+        self.net = torch.compile(net, dynamic=dynamic)
+
+        device = next(net.parameters()).device
+        with _inductor_cache(cache_dir), torch.no_grad():
+            self.net(torch.zeros(example_shape, device=device))
+
+    def forward(self, x):
+        return self.net(x)
+
+
+def _compile(net, ckpt_path, example_shape, dynamic=False):
+    # torch.compile 결과는 checkpoint 옆 <checkpoint 이름>_inductor/ 에 캐시
+    cache_dir = os.path.splitext(ckpt_path)[0] + '_inductor' if ckpt_path else None
+    return CompiledModule(ChannelsLast(fuse_unet(net)).eval(), cache_dir, example_shape, dynamic)
+
+
+## test / compare / infer 에서 사용할 추론용 모델 만들기
+def prepare_inference(net, backend='eager', ckpt_path=None, example_shape=(1, 1, 512, 512), dynamic=False):
+    # eager   : 학습한 모델 그대로
+    # fused   : Conv + BatchNorm 합치기, dropout 제거 등을 한 eval 전용 모델
+    # script  : fused 모델을 channels_last 로 TorchScript trace / freeze (ckpt_path 옆에 캐시)
+    # compile : fused 모델을 channels_last 로 example_shape 입력에서 torch.compile (ckpt_path 옆에 inductor 캐시,
+    #           입력 크기가 바뀌는 경우에만 dynamic=True)
+    # int8    : datasets/val 로 calibration 한 int8 모델 (CPU 전용, ckpt_path 옆에 캐시)
+    # onnx    : ckpt_path 옆에 내보낸 .onnx 를 ONNX Runtime 으로 실행 (CPU 전용)
+    if backend not in BACKENDS:
+        raise ValueError("unknown backend: %s (choose from %s)" % (backend, ', '.join(BACKENDS)))
+
+    net.eval()
+    if backend == 'fused':
+        return fuse_unet(net)
+    if backend == 'script':
+        return _script(net, ckpt_path, example_shape)
+    if backend == 'compile':
+        return _compile(net, ckpt_path, example_shape, dynamic)
+    if backend == 'int8':
+        # quantize 가 이 모듈을 import 하므로 여기서 불러옴
+        from quantize import load_int8
+        return load_int8(ckpt_path)
+    if backend == 'onnx':
+        from export_onnx import load_onnx
+        return load_onnx(ckpt_path)
+    return net
+
+
+## 추론 시간 재기
+def measure_latency(net, shape=(1, 1, 512, 512), repeat=10, warmup=2, device=None):
+    # 한 batch 당 평균 시간 (초)
+    if device is None:
+        device = next(iter(net.parameters()), torch.empty(0)).device
+    x = torch.randn(shape, device=device)
+
+    with torch.no_grad():
+        for _ in range(warmup):
+            net(x)
+
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        st = time.time()
+        for _ in range(repeat):
+            net(x)
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+
+    return (time.time() - st) / repeat
+
+
+def evaluate(model, dataset, num_eval=None):
+    # 평균 IoU (test 모드와 같은 iou_numpy), 픽셀 정확도, BCE loss
+    num = len(dataset) if num_eval is None else min(num_eval, len(dataset))
+    device = next(iter(model.parameters()), torch.empty(0)).device
+    fn_loss = nn.BCEWithLogitsLoss()
+
+    iou_arr = []
+    acc_arr = []
+    loss_arr = []
+    with torch.no_grad():
+        for i in range(num):
+            data = dataset[i]
+            output = model(data['input'].unsqueeze(0).to(device)).float().cpu()
+            label = data['label'].unsqueeze(0)
+
+            loss_arr += [fn_loss(output, label).item()]
+
+            output = (output > 0.5).float().numpy().transpose(0, 2, 3, 1)
+            label = label.numpy().transpose(0, 2, 3, 1)
+            iou_arr += [iou_numpy(output, label)]
+            acc_arr += [np.mean(output == label) * 100]
+
+    if not iou_arr:
+        return 0.0, 0.0, 0.0
+    return float(np.mean(iou_arr)), float(np.mean(acc_arr)), float(np.mean(loss_arr))
+
+
+def compare_backends(path, backends=BACKENDS, shape=(1, 1, 512, 512), repeat=10):
+    # checkpoint 하나를 backend 별로 만들어서 eager 와 출력 차이 / 512x512 한 장당 시간을 비교
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+    net = load_net(path, device).eval()
+
+    x = torch.randn(shape, device=device)
+    with torch.no_grad():
+        ref = net(x)
+
+    results = {}
+    for backend in backends:
+        model = prepare_inference(net, backend, ckpt_path=path, example_shape=shape)
+        with torch.no_grad():
+            diff = (model(x) - ref).abs().max().item()
+        latency = measure_latency(model, shape, repeat=repeat, device=device)
+        results[backend] = (latency, diff)
+
+        print("BACKEND %-8s | %.1f ms/frame | max diff %.2e" % (backend, latency * 1000 / shape[0], diff))
+
+    return results
+
+
+if __name__ == '__main__':
+    import sys
+    compare_backends(sys.argv[1])
@@ -1,6 +1,7 @@
 import sys
 import os
 import glob
+import multiprocessing
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
 from PyQt5.QtGui import *
@@ -206,7 +207,8 @@ class MyApp(QWidget):
         self.pretreatmentOpen.show()
         self.reset()
 
-        data_read()
+        # PyInstaller 로 묶은 exe 에서 worker 프로세스를 띄우지 않도록 GUI 에서는 한 프로세스로 전처리
+        data_read(num_workers=1)
         self.learningOpen()
 
         self.cancel_pre()
@@ -1202,10 +1204,12 @@ class MyApp(QWidget):
 
     def loading(self):
         path = './datasets/train/'
-        if not os.path.exists(path):
-            return self.dataset_alert()
-        if len(os.listdir(path)) == 0:
-            return self.dataset_alert()
+        # manifest 로 split 한 경우에는 train 디렉토리 없이 store 만 있음
+        if not has_manifest('./datasets/'):
+            if not os.path.exists(path):
+                return self.dataset_alert()
+            if len(os.listdir(path)) == 0:
+                return self.dataset_alert()
 
         # train으로 전달할 입력 데이터들 (입력받은 텍스트 값들)
         learn_value = self.learn_widget.text()
@@ -1676,6 +1680,9 @@ class MyApp(QWidget):
 
 
 if __name__ == '__main__':
+    # Windows 의 frozen exe 에서 multiprocessing worker 가 GUI 를 다시 띄우지 않게 함 (가장 먼저 불러야 함)
+    multiprocessing.freeze_support()
+
     app = QApplication(sys.argv)
     ex = MyApp()
 
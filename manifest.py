@@ -0,0 +1,110 @@
+import os
+import json
+import numpy as np
+
+MANIFEST_NAME = 'manifest.json'
+STORE_NAME = 'store'
+SPLIT_RATIOS = (3/4, 1/8, 1/8)
+
+
+def new_seed():
+    return int(np.random.SeedSequence().entropy % (2**32))
+
+
+## train / val / test 인덱스 나누기
+def make_split(nframe, seed=None, ratios=SPLIT_RATIOS):
+    if seed is None:
+        seed = new_seed()
+
+    nframe_train = int(nframe * ratios[0])
+    nframe_val = int(nframe * ratios[1])
+    nframe_test = int(nframe * ratios[2])
+
+    id_frame = np.random.default_rng(seed).permutation(nframe)
+
+    splits = {'train': id_frame[:nframe_train].tolist(),
+              'val': id_frame[nframe_train:nframe_train + nframe_val].tolist(),
+              'test': id_frame[nframe_train + nframe_val:nframe_train + nframe_val + nframe_test].tolist()}
+
+    return {'seed': seed, 'ratios': list(ratios), 'splits': splits}
+
+
+## k-fold 나누기 (test 는 고정하고 나머지를 k 개로 나눠 fold 번째를 val 로 사용)
+def make_kfold(nframe, k, fold, seed=None, test_ratio=1/8):
+    if seed is None:
+        seed = new_seed()
+
+    id_frame = np.random.default_rng(seed).permutation(nframe)
+
+    nframe_test = int(nframe * test_ratio)
+    id_test = id_frame[:nframe_test]
+    folds = np.array_split(id_frame[nframe_test:], k)
+
+    splits = {'train': np.concatenate([f for i, f in enumerate(folds) if i != fold]).tolist(),
+              'val': folds[fold].tolist(),
+              'test': id_test.tolist()}
+
+    return {'seed': seed, 'kfold': [k, fold], 'test_ratio': test_ratio, 'splits': splits}
+
+
+## manifest 저장 / 불러오기
+def manifest_path(data_dir):
+    return os.path.join(data_dir, MANIFEST_NAME)
+
+
+def has_manifest(data_dir):
+    return os.path.exists(manifest_path(data_dir))
+
+
+def expand_split(splits, groups):
+    # 원본 단위로 나눈 인덱스를 샘플(tile) 단위 인덱스로 바꿈
+    # 같은 원본에서 나온 tile 은 항상 같은 split 에 들어감
+    by_source = {}
+    for id, source_id in enumerate(groups):
+        by_source.setdefault(source_id, []).append(id)
+
+    return {name: [id for source_id in ids for id in by_source.get(source_id, [])]
+            for name, ids in splits.items()}
+
+
+def write_manifest(data_dir, split, sources, groups=None):
+    # groups 는 샘플별 원본 인덱스 (tile 로 자른 경우), None 이면 원본 하나가 샘플 하나
+    manifest = dict(split)
+    manifest['store'] = STORE_NAME
+    manifest['sources'] = sources
+    manifest['source_splits'] = split['splits']
+
+    if groups is not None:
+        manifest['groups'] = [int(g) for g in groups]
+        manifest['splits'] = expand_split(split['splits'], groups)
+        manifest['num_samples'] = len(groups)
+    else:
+        manifest['num_samples'] = len(sources)
+
+    tmp_path = manifest_path(data_dir) + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path(data_dir))
+
+    return manifest
+
+
+def load_manifest(data_dir):
+    with open(manifest_path(data_dir), 'r') as f:
+        return json.load(f)
+
+
+def resplit(data_dir, seed=None, ratios=SPLIT_RATIOS):
+    # 전처리 결과는 그대로 두고 manifest 의 인덱스만 다시 만듦
+    manifest = load_manifest(data_dir)
+    split = make_split(len(manifest['sources']), seed=seed, ratios=ratios)
+    return write_manifest(data_dir, split, manifest['sources'], manifest.get('groups'))
+
+
+def kfold(data_dir, k, fold, seed=None, test_ratio=1/8):
+    manifest = load_manifest(data_dir)
+    if seed is None:
+        # 같은 데이터셋의 fold 끼리는 같은 seed 를 써야 test 가 겹치지 않음
+        seed = manifest.get('seed')
+    split = make_kfold(len(manifest['sources']), k, fold, seed=seed, test_ratio=test_ratio)
+    return write_manifest(data_dir, split, manifest['sources'], manifest.get('groups'))
@@ -0,0 +1,33 @@
+import numpy as np
+
+LABEL_RAW = 0
+LABEL_PACKED = 1
+THRESHOLD = 128
+
+
+## 이진 mask 를 1 bit 로 압축하기
+def pack_mask(mask, threshold=THRESHOLD):
+    # 0/255 mask 를 threshold 기준으로 이진화한 뒤 8 픽셀을 1 byte 로 묶음
+    return np.packbits(np.asarray(mask) >= threshold)
+
+
+def packed_nbytes(shape):
+    return (int(np.prod(shape)) + 7) // 8
+
+
+def unpack_mask(bits, shape):
+    # 원래 라벨과 같은 0/255 uint8 로 되돌림
+    return np.unpackbits(bits, count=int(np.prod(shape))).reshape(shape) * np.uint8(255)
+
+
+## npy 디렉토리용 저장 / 불러오기
+def save_packed(path, mask, threshold=THRESHOLD):
+    np.savez(path, bits=pack_mask(mask, threshold), shape=np.array(mask.shape, dtype=np.int64))
+
+
+def load_label(path):
+    # label_*.npz 는 압축된 mask, label_*.npy 는 원래 uint8 라벨
+    if path.endswith('.npz'):
+        with np.load(path) as f:
+            return unpack_mask(f['bits'], tuple(f['shape']))
+    return np.load(path)
@@ -1,14 +1,73 @@
 import os
+import copy
 import numpy as np
 
 import torch
 import torch.nn as nn
+from torch.utils.checkpoint import checkpoint
+
+# 이름으로 고르는 UNet 설정 (current 는 기존 6 단계, 2048 채널 UNet)
+PRESETS = {
+    'tiny': {'base_channels': 16, 'depth': 4, 'channel_mult': 2},
+    'small': {'base_channels': 32, 'depth': 5, 'channel_mult': 2},
+    'base': {'base_channels': 64, 'depth': 5, 'channel_mult': 2},
+    'current': {'base_channels': 64, 'depth': 6, 'channel_mult': 2},
+}
+
+
+def default_channels(base_channels=64, depth=6, channel_mult=2):
+    # 층 이름별 출력 채널 수 (기본값: 단계마다 channel_mult 배)
+    width = [int(round(base_channels * channel_mult ** i)) for i in range(depth)]
+
+    channels = {}
+    for i in range(1, depth):
+        channels['enc%d_1' % i] = width[i - 1]
+        channels['enc%d_2' % i] = width[i - 1]
+        channels['unpool%d' % i] = width[i - 1]
+        channels['dec%d_2' % i] = width[i - 1]
+        channels['dec%d_1' % i] = width[max(i - 2, 0)]
+    channels['enc%d_1' % depth] = width[depth - 1]
+    channels['dec%d_1' % depth] = width[depth - 2]
+    channels['fc'] = max(width[0] // 2, 1)
+
+    return channels
+
+
+def unet_config(base_channels=64, depth=6, channel_mult=2, in_channels=1, out_channels=1, channels=None):
+    # checkpoint 에 저장하는 UNet 설정 (모델을 만들지 않고 설정끼리 비교할 때도 사용)
+    return {'base_channels': base_channels, 'depth': depth, 'channel_mult': channel_mult,
+            'in_channels': in_channels, 'out_channels': out_channels,
+            'channels': dict(channels) if channels is not None else None}
+
+
+def build_unet(arch='current'):
+    # arch 는 PRESETS 의 이름 또는 UNet 인자 dict
+    if isinstance(arch, str):
+        if arch not in PRESETS:
+            raise ValueError("unknown UNet preset: %s (choose from %s)" % (arch, ', '.join(PRESETS)))
+        arch = PRESETS[arch]
+    return UNet(**arch)
+
 
 ## 네트워크 구축하기
 class UNet(nn.Module):
-    def __init__(self):
+    # base_channels : 첫 단계 채널 수, depth : pooling 단계 수 + 1, channel_mult : 단계마다 늘리는 배수
+    # channels 로 층 이름별 출력 채널 수를 따로 줄 수 있음 (pruning 된 모델을 다시 만들 때 사용)
+    # 층 이름 (enc1_1, ..., dec1_1, fc, fc1) 은 기존 UNet 과 같아서 기존 checkpoint 를 그대로 읽을 수 있음
+    def __init__(self, base_channels=64, depth=6, channel_mult=2, in_channels=1, out_channels=1, channels=None):
         super(UNet, self).__init__()
 
+        self.depth = depth
+        # pooling 이 depth - 1 번이므로 입력 크기가 이 배수여야 skip connection 크기가 맞음
+        self.pad_multiple = 2 ** (depth - 1)
+        self.checkpointing = False
+        self.channels = default_channels(base_channels, depth, channel_mult)
+        if channels is not None:
+            self.channels.update(channels)
+
+        # checkpoint 에 저장해서 util.load 가 같은 구조를 다시 만들 수 있게 함
+        self.config = unet_config(base_channels, depth, channel_mult, in_channels, out_channels, channels)
+
         def CBR2d(in_channels, out_channels, kernel_size=3, stride=1, padding=1, bias=True):
             layers = []
             layers += [nn.Conv2d(in_channels=in_channels, out_channels=out_channels,
@@ -21,137 +80,135 @@ class UNet(nn.Module):
 
             return cbr
 
+        ch = self.channels
+
         # Contracting path
-        self.enc1_1 = CBR2d(in_channels=1, out_channels=64)
-        self.enc1_2 = CBR2d(in_channels=64, out_channels=64)
+        prev = in_channels
+        for i in range(1, depth):
+            setattr(self, 'enc%d_1' % i, CBR2d(in_channels=prev, out_channels=ch['enc%d_1' % i]))
+            setattr(self, 'enc%d_2' % i, CBR2d(in_channels=ch['enc%d_1' % i], out_channels=ch['enc%d_2' % i]))
+
+            setattr(self, 'pool%d' % i, nn.MaxPool2d(kernel_size=2))
+            prev = ch['enc%d_2' % i]
+
+        setattr(self, 'enc%d_1' % depth, CBR2d(in_channels=prev, out_channels=ch['enc%d_1' % depth]))
 
-        self.pool1 = nn.MaxPool2d(kernel_size=2)
-        
+        # Expansive path
+        setattr(self, 'dec%d_1' % depth, CBR2d(in_channels=ch['enc%d_1' % depth], out_channels=ch['dec%d_1' % depth]))
+        prev = ch['dec%d_1' % depth]
 
-        self.enc2_1 = CBR2d(in_channels=64, out_channels=128)
-        self.enc2_2 = CBR2d(in_channels=128, out_channels=128)
+        for i in range(depth - 1, 0, -1):
+            setattr(self, 'unpool%d' % i, nn.ConvTranspose2d(in_channels=prev, out_channels=ch['unpool%d' % i],
+                                                             kernel_size=2, stride=2, padding=0, bias=True))
 
-        self.pool2 = nn.MaxPool2d(kernel_size=2)
+            setattr(self, 'dec%d_2' % i, CBR2d(in_channels=ch['unpool%d' % i] + ch['enc%d_2' % i],
+                                               out_channels=ch['dec%d_2' % i]))
+            setattr(self, 'dec%d_1' % i, CBR2d(in_channels=ch['dec%d_2' % i], out_channels=ch['dec%d_1' % i]))
+            prev = ch['dec%d_1' % i]
 
-        self.enc3_1 = CBR2d(in_channels=128, out_channels=256)
-        self.enc3_2 = CBR2d(in_channels=256, out_channels=256)
+        self.dropout = nn.Dropout(0.2)
 
-        self.pool3 = nn.MaxPool2d(kernel_size=2)
+        self.fc = nn.Conv2d(in_channels=prev, out_channels=ch['fc'], kernel_size=1, stride=1, padding=0, bias=True)
+        self.fc1 = nn.Conv2d(in_channels=ch['fc'], out_channels=out_channels, kernel_size=1, stride=1, padding=0, bias=True)
 
-        self.enc4_1 = CBR2d(in_channels=256, out_channels=512)
-        self.enc4_2 = CBR2d(in_channels=512, out_channels=512)
+    def set_checkpointing(self, enabled=True):
+        # 학습할 때 CBR2d 두 개 (enc*_1 + enc*_2, dec*_2 + dec*_1 등) 의 중간 activation 을 저장하지 않고
+        # backward 에서 다시 계산해서 메모리를 줄임 (연산은 forward 한 번만큼 늘어남)
+        self.checkpointing = enabled
+        return self
 
-        self.pool4 = nn.MaxPool2d(kernel_size=2)
+    def _pair(self, first, second, x):
+        first, second = getattr(self, first), getattr(self, second)
+        if not (self.checkpointing and self.training and torch.is_grad_enabled()):
+            return second(first(x))
 
-        self.enc5_1 = CBR2d(in_channels=512, out_channels=1024)
-        self.enc5_2 = CBR2d(in_channels=1024, out_channels=1024)
-        
-        self.pool5 = nn.MaxPool2d(kernel_size=2)
-        
-        self.enc6_1 = CBR2d(in_channels=1024, out_channels=2048)
+        calls = [0]
 
-        # Expansive path
-        
-        self.dec6_1 = CBR2d(in_channels=2048, out_channels=1024)
-        
-        self.unpool5 = nn.ConvTranspose2d(in_channels=1024, out_channels=1024,
-                                          kernel_size=2, stride=2, padding=0, bias=True)
-                                          
-        
-        self.dec5_2 = CBR2d(in_channels=2 * 1024, out_channels=1024)
-        self.dec5_1 = CBR2d(in_channels=1024, out_channels=512)
+        def run(x):
+            # backward 에서 다시 계산할 때는 BatchNorm running 통계가 두 번 갱신되지 않도록 momentum 을 0 으로 둠
+            calls[0] += 1
+            if calls[0] == 1:
+                return second(first(x))
 
-        self.unpool4 = nn.ConvTranspose2d(in_channels=512, out_channels=512,
-                                          kernel_size=2, stride=2, padding=0, bias=True)
+            bns = [bn for layer in (first, second) for bn in layer.modules() if isinstance(bn, nn.BatchNorm2d)]
+            momentum = [bn.momentum for bn in bns]
+            for bn in bns:
+                bn.momentum = 0.0
+            try:
+                return second(first(x))
+            finally:
+                for bn, m in zip(bns, momentum):
+                    bn.momentum = m
 
-        self.dec4_2 = CBR2d(in_channels=2 * 512, out_channels=512)
-        self.dec4_1 = CBR2d(in_channels=512, out_channels=256)
+        return checkpoint(run, x, use_reentrant=False)
 
-        self.unpool3 = nn.ConvTranspose2d(in_channels=256, out_channels=256,
-                                          kernel_size=2, stride=2, padding=0, bias=True)
+    def forward(self, x):
+        depth = self.depth
+
+        skips = []
+        for i in range(1, depth):
+            x = self._pair('enc%d_1' % i, 'enc%d_2' % i, x)
+            skips.append(x)
+            x = getattr(self, 'pool%d' % i)(x)
+            x = self.dropout(x)
+
+        x = self._pair('enc%d_1' % depth, 'dec%d_1' % depth, x)
+
+        for i in range(depth - 1, 0, -1):
+            x = getattr(self, 'unpool%d' % i)(x)
+            # 기존 UNet 과 같이 dropout 은 가장 깊은 unpool 다음에만 적용
+            if i == depth - 1:
+                x = self.dropout(x)
+            x = torch.cat((x, skips[i - 1]), dim=1)
+            x = self._pair('dec%d_2' % i, 'dec%d_1' % i, x)
+
+        x = self.fc(x)
+        x = self.fc1(x)
 
-        self.dec3_2 = CBR2d(in_channels=2 * 256, out_channels=256)
-        self.dec3_1 = CBR2d(in_channels=256, out_channels=128)
+        return x
 
-        self.unpool2 = nn.ConvTranspose2d(in_channels=128, out_channels=128,
-                                          kernel_size=2, stride=2, padding=0, bias=True)
 
-        self.dec2_2 = CBR2d(in_channels=2 * 128, out_channels=128)
-        self.dec2_1 = CBR2d(in_channels=128, out_channels=64)
+## 추론용 모델 최적화
+@torch.no_grad()
+def fuse_conv_bn(conv, bn):
+    # eval 모드의 BatchNorm 을 conv 의 weight / bias 에 합침
+    # y = gamma * (conv(x) - mean) / sqrt(var + eps) + beta
+    fused = nn.Conv2d(conv.in_channels, conv.out_channels, kernel_size=conv.kernel_size, stride=conv.stride,
+                      padding=conv.padding, dilation=conv.dilation, groups=conv.groups, bias=True)
 
-        self.unpool1 = nn.ConvTranspose2d(in_channels=64, out_channels=64,
-                                          kernel_size=2, stride=2, padding=0, bias=True)
+    scale = bn.weight / torch.sqrt(bn.running_var + bn.eps)
+    bias = conv.bias if conv.bias is not None else torch.zeros_like(bn.running_mean)
 
-        self.dec1_2 = CBR2d(in_channels=2 * 64, out_channels=64)
-        self.dec1_1 = CBR2d(in_channels=64, out_channels=64)
-        
-        self.dropout = nn.Dropout(0.2)
+    fused.weight.copy_(conv.weight * scale.reshape(-1, 1, 1, 1))
+    fused.bias.copy_((bias - bn.running_mean) * scale + bn.bias)
 
-        self.fc = nn.Conv2d(in_channels=64, out_channels=32, kernel_size=1, stride=1, padding=0, bias=True)
-        self.fc1 = nn.Conv2d(in_channels=32, out_channels=1, kernel_size=1, stride=1, padding=0, bias=True)
+    return fused.to(conv.weight.device)
 
-    def forward(self, x):
-        enc1_1 = self.enc1_1(x)
-        enc1_2 = self.enc1_2(enc1_1)
-        pool1 = self.pool1(enc1_2)
-        pool1 = self.dropout(pool1)
-
-        enc2_1 = self.enc2_1(pool1)
-        enc2_2 = self.enc2_2(enc2_1)
-        pool2 = self.pool2(enc2_2)
-        pool2 = self.dropout(pool2)
-
-        enc3_1 = self.enc3_1(pool2)
-        enc3_2 = self.enc3_2(enc3_1)
-        pool3 = self.pool3(enc3_2)
-        pool3 = self.dropout(pool3)
-
-        enc4_1 = self.enc4_1(pool3)
-        enc4_2 = self.enc4_2(enc4_1)
-        pool4 = self.pool4(enc4_2)
-        pool4 = self.dropout(pool4)
-
-        enc5_1 = self.enc5_1(pool4)
-        enc5_2 = self.enc5_2(enc5_1)
-        pool5 = self.pool5(enc5_2)
-        pool5 = self.dropout(pool5)
-        
-        enc6_1 = self.enc6_1(pool5)
-
-        dec6_1 = self.dec6_1(enc6_1)
-        
-        unpool5 = self.unpool5(dec6_1)
-        unpool5 = self.dropout(unpool5)
-        cat5 = torch.cat((unpool5, enc5_2), dim=1)
-        dec5_2 = self.dec5_2(cat5)
-        dec5_1 = self.dec5_1(dec5_2)
-        
-
-        unpool4 = self.unpool4(dec5_1)
-        unpool5 = self.dropout(unpool4)
-        cat4 = torch.cat((unpool4, enc4_2), dim=1)
-        dec4_2 = self.dec4_2(cat4)
-        dec4_1 = self.dec4_1(dec4_2)
-
-        unpool3 = self.unpool3(dec4_1)
-        unpool5 = self.dropout(unpool3)
-        cat3 = torch.cat((unpool3, enc3_2), dim=1)
-        dec3_2 = self.dec3_2(cat3)
-        dec3_1 = self.dec3_1(dec3_2)
-
-        unpool2 = self.unpool2(dec3_1)
-        unpool5 = self.dropout(unpool2)
-        cat2 = torch.cat((unpool2, enc2_2), dim=1)
-        dec2_2 = self.dec2_2(cat2)
-        dec2_1 = self.dec2_1(dec2_2)
-
-        unpool1 = self.unpool1(dec2_1)
-        unpool5 = self.dropout(unpool1)
-        cat1 = torch.cat((unpool1, enc1_2), dim=1)
-        dec1_2 = self.dec1_2(cat1)
-        dec1_1 = self.dec1_1(dec1_2)
-
-        x = self.fc(dec1_1)
-        x = self.fc1(x)
 
-        return x
+@torch.no_grad()
+def fuse_unet(net):
+    # 추론 전용 UNet 만들기 (원래 net 은 그대로 둠)
+    # - CBR2d 의 Conv + BatchNorm 을 conv 하나로 합침
+    # - dropout 을 없앰
+    # - 사이에 활성화 함수가 없는 1x1 conv 두 개 (fc, fc1) 를 1x1 conv 하나로 합침
+    fused = copy.deepcopy(net).eval()
+
+    for name, module in fused.named_children():
+        if isinstance(module, nn.Sequential) and len(module) == 3 and isinstance(module[1], nn.BatchNorm2d):
+            module[0] = fuse_conv_bn(module[0], module[1])
+            module[1] = nn.Identity()
+
+    fused.dropout = nn.Identity()
+
+    if isinstance(fused.fc, nn.Conv2d) and isinstance(fused.fc1, nn.Conv2d):
+        w0, w1 = fused.fc.weight[:, :, 0, 0], fused.fc1.weight[:, :, 0, 0]
+        fc = nn.Conv2d(fused.fc.in_channels, fused.fc1.out_channels, kernel_size=1, bias=True).to(w0.device)
+        fc.weight.copy_((w1 @ w0)[:, :, None, None])
+        fc.bias.copy_(w1 @ fused.fc.bias + fused.fc1.bias)
+        fused.fc = fc
+        fused.fc1 = nn.Identity()
+
+    for p in fused.parameters():
+        p.requires_grad_(False)
+
+    return fused
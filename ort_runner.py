@@ -0,0 +1,21 @@
+import numpy as np
+import onnxruntime as ort
+
+
+## ONNX Runtime 으로 UNet 추론하기
+class OnnxRunner(object):
+    # torch 없이 .onnx 만으로 추론 (입력 / 출력은 float32 NCHW numpy)
+    # 그래프 최적화는 ORT_ENABLE_ALL 로 켜고 CPU provider 사용
+    def __init__(self, path, num_threads=None):
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+
+        self.session = ort.InferenceSession(path, sess_options=options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, x):
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        return self.session.run(None, {self.input_name: x})[0]
+
@@ -0,0 +1,224 @@
+import os
+import time
+import numpy as np
+
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader
+from torchvision import transforms
+
+from model import UNet
+from util import load_net, save
+from dataset import Dataset, RandomFlip, Normalization, ToTensor
+from inference import evaluate
+
+# 기본으로 줄이는 층 : 채널이 가장 많은 가장 깊은 두 단계 (current UNet 의 enc5_*, enc6_1, dec6_1, dec5_*, unpool5)
+DEEP_LEVELS = 2
+
+
+## 층별 연결 관계
+def _links(net):
+    # 층 이름 -> (종류, 입력 채널을 정하는 층 목록)
+    # 입력 채널은 목록의 층 출력 채널을 순서대로 이어 붙인 것 (dec*_2 는 unpool 과 skip 을 cat)
+    depth = net.depth
+    links = {'enc1_1': ('cbr', [None])}
+    for i in range(1, depth):
+        links['enc%d_2' % i] = ('cbr', ['enc%d_1' % i])
+        links['enc%d_1' % (i + 1)] = ('cbr', ['enc%d_2' % i])
+    links['dec%d_1' % depth] = ('cbr', ['enc%d_1' % depth])
+    for i in range(depth - 1, 0, -1):
+        links['unpool%d' % i] = ('convt', ['dec%d_1' % (i + 1)])
+        links['dec%d_2' % i] = ('cbr', ['unpool%d' % i, 'enc%d_2' % i])
+        links['dec%d_1' % i] = ('cbr', ['dec%d_2' % i])
+    links['fc'] = ('conv', ['dec1_1'])
+    links['fc1'] = ('conv', ['fc'])
+    return links
+
+
+def default_layers(net, levels=DEEP_LEVELS):
+    # 가장 깊은 levels 단계에 속하는 층 이름
+    depth = net.depth
+    names = []
+    for i in range(depth - levels + 1, depth + 1):
+        names += [n for n in ('enc%d_1' % i, 'enc%d_2' % i, 'dec%d_1' % i, 'dec%d_2' % i, 'unpool%d' % i)
+                  if n in net.channels]
+    return names
+
+
+## 채널 중요도 구하기
+def channel_scores(net, name, method='bn'):
+    # bn : BatchNorm scale |gamma|, l1 : 출력 채널별 conv weight L1 norm
+    # BatchNorm 이 없는 층 (unpool, fc) 은 항상 L1 norm
+    module = getattr(net, name)
+    if isinstance(module, nn.Sequential):
+        if method == 'bn':
+            return module[1].weight.detach().abs()
+        return module[0].weight.detach().abs().sum(dim=(1, 2, 3))
+    if isinstance(module, nn.ConvTranspose2d):
+        return module.weight.detach().abs().sum(dim=(0, 2, 3))
+    return module.weight.detach().abs().sum(dim=(1, 2, 3))
+
+
+def select_channels(net, layers, amount=0.5, method='bn', min_channels=8):
+    # 층마다 중요도가 높은 채널을 (1 - amount) 비율만큼 남김 (남기는 채널 번호는 원래 순서대로)
+    keep = {}
+    for name in net.channels:
+        n = net.channels[name]
+        if name not in layers:
+            keep[name] = torch.arange(n)
+            continue
+        k = min(n, max(min_channels, int(round(n * (1 - amount)))))
+        keep[name] = torch.sort(torch.topk(channel_scores(net, name, method), k).indices).values.cpu()
+    return keep
+
+
+## 채널을 실제로 지운 작은 UNet 만들기
+@torch.no_grad()
+def prune_unet(net, keep):
+    config = dict(net.config)
+    config['channels'] = {name: len(idx) for name, idx in keep.items()}
+    pruned = UNet(**config).to(next(net.parameters()).device)
+
+    for name, (kind, inputs) in _links(net).items():
+        # 입력 채널 번호 : 앞 층들의 남긴 채널 번호를 cat 순서대로 offset 을 더해서 이어 붙임
+        in_idx = []
+        offset = 0
+        for src in inputs:
+            if src is None:
+                in_idx.append(torch.arange(net.config['in_channels']))
+                continue
+            in_idx.append(keep[src] + offset)
+            offset += net.channels[src]
+        in_idx = torch.cat(in_idx)
+        out_idx = keep.get(name)
+
+        old, new = getattr(net, name), getattr(pruned, name)
+        if kind == 'cbr':
+            conv, bn = old[0], old[1]
+            new[0].weight.copy_(conv.weight[out_idx][:, in_idx])
+            new[0].bias.copy_(conv.bias[out_idx])
+            for attr in ('weight', 'bias', 'running_mean', 'running_var'):
+                getattr(new[1], attr).copy_(getattr(bn, attr)[out_idx])
+            new[1].num_batches_tracked.copy_(bn.num_batches_tracked)
+        elif kind == 'convt':
+            # ConvTranspose2d weight 는 (입력, 출력, k, k)
+            new.weight.copy_(old.weight[in_idx][:, out_idx])
+            new.bias.copy_(old.bias[out_idx])
+        elif out_idx is not None:
+            new.weight.copy_(old.weight[out_idx][:, in_idx])
+            new.bias.copy_(old.bias[out_idx])
+        else:
+            # fc1 은 출력 채널을 줄이지 않음
+            new.weight.copy_(old.weight[:, in_idx])
+            new.bias.copy_(old.bias)
+
+    return pruned
+
+
+## parameter 수와 FLOPs 세기
+def count_params(net):
+    return sum(p.numel() for p in net.parameters())
+
+
+def count_flops(net, shape=(1, 1, 512, 512)):
+    # conv / transposed conv 의 곱셈-덧셈을 2 FLOPs 로 셈 (BatchNorm, ReLU 등은 제외)
+    flops = [0]
+
+    def hook(module, inputs, output):
+        if isinstance(module, nn.ConvTranspose2d):
+            # 입력 픽셀마다 (출력 채널 x k x k) 만큼 뿌림
+            x = inputs[0]
+            flops[0] += 2 * x.numel() * module.out_channels * module.kernel_size[0] * module.kernel_size[1] // module.groups
+        else:
+            k = module.in_channels // module.groups * module.kernel_size[0] * module.kernel_size[1]
+            flops[0] += 2 * output.numel() * k
+
+    handles = [m.register_forward_hook(hook) for m in net.modules()
+               if isinstance(m, (nn.Conv2d, nn.ConvTranspose2d))]
+    device = next(net.parameters()).device
+    with torch.no_grad():
+        was_training = net.training
+        net.eval()
+        net(torch.zeros(shape, device=device))
+        net.train(was_training)
+    for h in handles:
+        h.remove()
+
+    return flops[0]
+
+
+## 짧게 다시 학습하기
+def finetune(net, data_dir='./datasets', num_epoch=1, lr=1e-4, batch_size=2, num_workers=0):
+    device = next(net.parameters()).device
+    dataset = Dataset(data_dir=data_dir, split='train', transform=transforms.Compose(
+        [RandomFlip(), Normalization(mean=0.5, std=0.5), ToTensor()]))
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=True, num_workers=num_workers)
+
+    fn_loss = nn.BCEWithLogitsLoss().to(device)
+    optim = torch.optim.Adam(net.parameters(), lr=lr)
+
+    for epoch in range(1, num_epoch + 1):
+        net.train()
+        loss_arr = []
+        for batch, data in enumerate(loader, 1):
+            label = data['label'].to(device)
+            input = data['input'].to(device)
+
+            output = net(input)
+
+            optim.zero_grad()
+            loss = fn_loss(output, label)
+            loss.backward()
+            optim.step()
+
+            loss_arr += [loss.item()]
+
+        print("FINETUNE: EPOCH %04d / %04d | LOSS %.4f" % (epoch, num_epoch, np.mean(loss_arr) if loss_arr else 0))
+
+    return net, optim
+
+
+def prune_checkpoint(path, amount=0.5, method='bn', layers=None, min_channels=8, finetune_epochs=1, lr=1e-4,
+                     batch_size=2, data_dir='./datasets', num_eval=None):
+    # path 의 checkpoint 에서 layers (기본: 가장 깊은 두 단계) 의 채널을 amount 비율만큼 지우고
+    # datasets/train 으로 finetune_epochs 만큼 다시 학습한 뒤 <이름>_pruned_model.pth 로 저장
+    # 전 / 후의 parameter 수, 512x512 한 장당 FLOPs, datasets/val IoU 를 출력
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+    net = load_net(path, device)
+    dict_model = torch.load(path, map_location='cpu')
+    epoch = dict_model['epoch']
+
+    dataset_val = Dataset(data_dir=data_dir, split='val', transform=transforms.Compose(
+        [Normalization(mean=0.5, std=0.5), ToTensor()]))
+
+    if layers is None:
+        layers = default_layers(net)
+
+    net.eval()
+    before = (count_params(net), count_flops(net), evaluate(net, dataset_val, num_eval)[0])
+
+    st = time.time()
+    pruned = prune_unet(net, select_channels(net, layers, amount, method, min_channels))
+    pruned_iou = evaluate(pruned.eval(), dataset_val, num_eval)[0]
+
+    pruned, optim = finetune(pruned, data_dir=data_dir, num_epoch=finetune_epochs, lr=lr, batch_size=batch_size)
+    pruned.eval()
+    iou, acc, loss = evaluate(pruned, dataset_val, num_eval)
+    after = (count_params(pruned), count_flops(pruned), iou)
+    print("PRUNE: %d layers | %.1f sec" % (len(layers), time.time() - st))
+
+    name = dict_model.get('name', os.path.splitext(os.path.basename(path))[0]) + '_pruned'
+    save(ckpt_dir=os.path.dirname(path) or '.', net=pruned, optim=optim, epoch=epoch + finetune_epochs, name=name,
+         loss=loss, iou=iou, acc=acc, lr=lr, batch=batch_size, precision=dict_model.get('precision', 'fp32'))
+
+    print("BEFORE : %.2f M params | %.1f GFLOPs | IoU %.4f" % (before[0] / 1e6, before[1] / 1e9, before[2]))
+    print("PRUNED : IoU %.4f (before fine-tune)" % pruned_iou)
+    print("AFTER  : %.2f M params | %.1f GFLOPs | IoU %.4f" % (after[0] / 1e6, after[1] / 1e9, after[2]))
+
+    return pruned, before, after
+
+
+if __name__ == '__main__':
+    import sys
+    prune_checkpoint(sys.argv[1])
@@ -0,0 +1,108 @@
+import os
+import time
+import numpy as np
+
+import torch
+import torch.nn as nn
+from torch.ao.quantization import get_default_qconfig_mapping
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+from torchvision import transforms
+
+from util import load_net, is_fresh
+from dataset import Dataset, Normalization, ToTensor
+from inference import artifact_path, measure_latency, evaluate
+
+QENGINE = 'x86' if 'x86' in torch.backends.quantized.supported_engines else 'fbgemm'
+
+
+class CPUModule(nn.Module):
+    # int8 모델은 CPU 에서만 돌기 때문에 입력을 CPU 로 옮기고 결과를 원래 device 로 되돌림
+    def __init__(self, model):
+        super(CPUModule, self).__init__()
+        self.model = model
+
+    def forward(self, x):
+        return self.model(x.cpu()).to(x.device)
+
+
+def _split_dataset(data_dir, split):
+    return Dataset(data_dir=data_dir, split=split,
+                   transform=transforms.Compose([Normalization(mean=0.5, std=0.5), ToTensor()]))
+
+
+## 학습한 checkpoint 를 int8 로 양자화하기
+def quantize_net(net, dataset, num_calib=32, seed=0):
+    # FX graph mode post-training quantization
+    # Conv + BatchNorm + ReLU 를 합친 뒤 dataset 에서 무작위로 고른 num_calib 장으로 activation 범위를 정함
+    torch.backends.quantized.engine = QENGINE
+    net = net.cpu().eval()
+
+    example = dataset[0]['input'].unsqueeze(0)
+    prepared = prepare_fx(net, get_default_qconfig_mapping(QENGINE), example_inputs=(example,))
+
+    ids = np.random.default_rng(seed).permutation(len(dataset))[:num_calib]
+    with torch.no_grad():
+        for i in ids:
+            prepared(dataset[int(i)]['input'].unsqueeze(0))
+
+    return convert_fx(prepared)
+
+
+def quantize_checkpoint(path, data_dir='./datasets', num_calib=32, num_eval=None, report=True):
+    # path 의 checkpoint 를 datasets/val 로 calibration 해서 <checkpoint>_int8_cpu.pt 로 저장하고
+    # calibration 에 쓰지 않은 datasets/test 에서 잰 fp32 와 int8 의 IoU / 지연 시간을 <checkpoint>_int8_report.txt 로 남김
+    net = load_net(path).eval()
+    dataset = _split_dataset(data_dir, 'val')
+
+    st = time.time()
+    qnet = quantize_net(net, dataset, num_calib=num_calib)
+    print("QUANTIZE: %d calibration images | %.1f sec" % (min(num_calib, len(dataset)), time.time() - st))
+
+    example = dataset[0]['input'].unsqueeze(0)
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(qnet, example))
+
+    out_path = artifact_path(path, 'int8', torch.device('cpu'))
+    torch.jit.save(traced, out_path)
+    print("int8 model: %s" % out_path)
+
+    if report:
+        report_int8(net, traced, _split_dataset(data_dir, 'test'), os.path.splitext(path)[0] + '_int8_report.txt',
+                    num_eval=num_eval)
+
+    return traced
+
+
+def report_int8(net, qnet, dataset, report_path, num_eval=None):
+    shape = (1,) + tuple(dataset[0]['input'].shape)
+
+    lines = []
+    for tag, model in (('fp32', net), ('int8', qnet)):
+        iou, _, _ = evaluate(model, dataset, num_eval)
+        latency = measure_latency(model, shape, device=torch.device('cpu'))
+        lines.append("%s | IoU %.4f | %.1f ms/frame" % (tag, iou, latency * 1000))
+        print("REPORT %s" % lines[-1])
+
+    with open(report_path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+    return lines
+
+
+def load_int8(ckpt_path, data_dir='./datasets'):
+    # 저장해 둔 int8 모델이 checkpoint 보다 새것이면 읽고, 아니면 새로 양자화
+    # (backend 를 불러오는 중이므로 test 전체를 도는 report 는 만들지 않음, 필요하면 quantize_checkpoint 를 직접 실행)
+    path = artifact_path(ckpt_path, 'int8', torch.device('cpu'))
+    torch.backends.quantized.engine = QENGINE
+
+    if is_fresh(path, ckpt_path):
+        model = torch.jit.load(path, map_location='cpu')
+    else:
+        model = quantize_checkpoint(ckpt_path, data_dir=data_dir, report=False)
+
+    return CPUModule(model).eval()
+
+
+if __name__ == '__main__':
+    import sys
+    quantize_checkpoint(sys.argv[1])
@@ -0,0 +1,86 @@
+import numpy as np
+
+import torch
+import torch.multiprocessing as mp
+
+
+## DataLoader worker 끼리 공유하는 LRU 샘플 캐시
+class SampleCache(object):
+    # 공유 메모리를 같은 크기의 slot 으로 나눠서 decode 된 uint8 샘플 (input, label) 을 저장
+    # byte budget 을 넘으면 가장 오래 안 쓴 slot 을 비움
+    # 공유 tensor 와 lock 은 worker 를 만들 때 같이 넘어가므로 fork / spawn 모두에서 공유됨
+    def __init__(self, budget_bytes, num_samples, input_shape, label_shape):
+        self.input_shape = tuple(input_shape)
+        self.label_shape = tuple(label_shape)
+        self.input_bytes = int(np.prod(self.input_shape))
+        self.label_bytes = int(np.prod(self.label_shape))
+        self.slot_bytes = self.input_bytes + self.label_bytes
+
+        self.num_slots = int(min(num_samples, budget_bytes // self.slot_bytes))
+
+        self.data = torch.zeros((self.num_slots, self.slot_bytes), dtype=torch.uint8).share_memory_()
+        self.slot_of = torch.full((num_samples,), -1, dtype=torch.int64).share_memory_()
+        self.owner = torch.full((self.num_slots,), -1, dtype=torch.int64).share_memory_()
+        self.last_used = torch.zeros(self.num_slots, dtype=torch.int64).share_memory_()
+        self.clock = torch.zeros(1, dtype=torch.int64).share_memory_()
+        self.stats = torch.zeros(2, dtype=torch.int64).share_memory_()  # hit, miss
+
+        self.lock = mp.Lock()
+
+    def __len__(self):
+        return int((self.owner >= 0).sum())
+
+    def nbytes(self):
+        return self.num_slots * self.slot_bytes
+
+    def _tick(self, slot):
+        self.clock += 1
+        self.last_used[slot] = self.clock[0]
+
+    def get(self, index):
+        # 없으면 None, 있으면 (input, label) 복사본
+        with self.lock:
+            slot = int(self.slot_of[index])
+            if slot < 0 or int(self.owner[slot]) != index:
+                self.stats[1] += 1
+                return None
+
+            self._tick(slot)
+            self.stats[0] += 1
+
+            row = self.data[slot].numpy()
+            input = row[:self.input_bytes].reshape(self.input_shape).copy()
+            label = row[self.input_bytes:].reshape(self.label_shape).copy()
+
+        return input, label
+
+    def put(self, index, input, label):
+        # slot 크기와 다른 샘플은 캐시하지 않음
+        if self.num_slots == 0 or input.shape != self.input_shape or label.shape != self.label_shape:
+            return False
+
+        with self.lock:
+            if int(self.slot_of[index]) >= 0 and int(self.owner[self.slot_of[index]]) == index:
+                return True
+
+            # 빈 slot 이 있으면 사용하고, 없으면 가장 오래 안 쓴 slot 을 비움
+            free = (self.owner < 0).nonzero()
+            if len(free) > 0:
+                slot = int(free[0])
+            else:
+                slot = int(torch.argmin(self.last_used))
+                self.slot_of[self.owner[slot]] = -1
+
+            row = self.data[slot].numpy()
+            row[:self.input_bytes] = np.asarray(input, dtype=np.uint8).reshape(-1)
+            row[self.input_bytes:] = np.asarray(label, dtype=np.uint8).reshape(-1)
+
+            self.owner[slot] = index
+            self.slot_of[index] = slot
+            self._tick(slot)
+
+        return True
+
+    def hit_rate(self):
+        hit, miss = int(self.stats[0]), int(self.stats[1])
+        return hit / max(hit + miss, 1)
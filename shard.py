@@ -0,0 +1,127 @@
+import os
+import zlib
+import numpy as np
+
+from masks import *
+
+SHARD_INDEX_NAME = 'shard_index.npy'
+INPUT_SHARD = 'input.shard'
+LABEL_SHARD = 'label.shard'
+
+
+def is_shard_dir(data_dir):
+    return os.path.exists(os.path.join(data_dir, SHARD_INDEX_NAME))
+
+
+def remove_shard(data_dir):
+    for f in (SHARD_INDEX_NAME, INPUT_SHARD, LABEL_SHARD):
+        if os.path.exists(os.path.join(data_dir, f)):
+            os.remove(os.path.join(data_dir, f))
+
+
+def _shape3(arr):
+    if arr.ndim == 2:
+        return arr.shape[0], arr.shape[1], 1
+    return arr.shape
+
+
+## split 하나를 uint8 shard 파일 하나로 쓰기
+class ShardWriter(object):
+    def __init__(self, data_dir, label_format=LABEL_RAW):
+        self.data_dir = data_dir
+        self.label_format = label_format
+
+        if not os.path.exists(data_dir):
+            os.makedirs(data_dir)
+
+        self.f_input = open(os.path.join(data_dir, INPUT_SHARD), 'wb')
+        self.f_label = open(os.path.join(data_dir, LABEL_SHARD), 'wb')
+
+        # 샘플별 (input offset, h, w, c, label offset, h, w, c, label format, crc32)
+        # crc32 는 input / label 내용의 checksum (샘플 단위 index 를 갱신할 때 사용)
+        self.records = []
+        self.input_offset = 0
+        self.label_offset = 0
+
+    def append(self, input_, label_):
+        input_ = np.ascontiguousarray(input_, dtype=np.uint8)
+        label_ = np.ascontiguousarray(label_, dtype=np.uint8)
+
+        crc = zlib.crc32(label_.tobytes(), zlib.crc32(input_.tobytes()))
+        self.records.append((self.input_offset,) + _shape3(input_) +
+                            (self.label_offset,) + _shape3(label_) + (self.label_format, crc))
+
+        # 압축 라벨은 8 픽셀을 1 byte 로 묶어서 씀
+        if self.label_format == LABEL_PACKED:
+            label_ = pack_mask(label_)
+
+        self.f_input.write(input_.tobytes())
+        self.f_label.write(label_.tobytes())
+        self.input_offset += input_.nbytes
+        self.label_offset += label_.nbytes
+
+    def close(self):
+        self.f_input.close()
+        self.f_label.close()
+
+        index = np.array(self.records, dtype=np.int64).reshape(-1, 10)
+        np.save(os.path.join(self.data_dir, SHARD_INDEX_NAME), index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+## np.memmap 으로 shard 읽기
+class ShardReader(object):
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.index = np.load(os.path.join(data_dir, SHARD_INDEX_NAME))
+
+        # memmap 은 DataLoader worker 안에서 처음 접근할 때 연다
+        self._input = None
+        self._label = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getstate__(self):
+        # pickle 시 memmap 이 통째로 복사되지 않도록 제외
+        state = self.__dict__.copy()
+        state['_input'] = None
+        state['_label'] = None
+        return state
+
+    def _open(self):
+        if len(self.index) == 0:
+            self._input = self._label = np.zeros(0, dtype=np.uint8)
+            return
+        self._input = np.memmap(os.path.join(self.data_dir, INPUT_SHARD), dtype=np.uint8, mode='r')
+        self._label = np.memmap(os.path.join(self.data_dir, LABEL_SHARD), dtype=np.uint8, mode='r')
+
+    def checksum(self, index):
+        # 저장할 때 구한 input / label crc32, 예전 index 에는 없으므로 None
+        if self.index.shape[1] > 9:
+            return int(self.index[index][9])
+        return None
+
+    def get(self, index):
+        if self._input is None:
+            self._open()
+
+        # label format 열이 없는 예전 index 는 원래 uint8 라벨
+        in_off, in_h, in_w, in_c, lb_off, lb_h, lb_w, lb_c = self.index[index][:8]
+        lb_format = self.index[index][8] if self.index.shape[1] > 8 else LABEL_RAW
+
+        # 복사 없이 shard 의 view 를 반환
+        input = self._input[in_off:in_off + in_h * in_w * in_c].reshape(in_h, in_w, in_c)
+
+        # 압축 라벨은 읽는 순간에만 풀어서 반환
+        if lb_format == LABEL_PACKED:
+            label = unpack_mask(self._label[lb_off:lb_off + packed_nbytes((lb_h, lb_w, lb_c))], (lb_h, lb_w, lb_c))
+        else:
+            label = self._label[lb_off:lb_off + lb_h * lb_w * lb_c].reshape(lb_h, lb_w, lb_c)
+
+        return input, label
@@ -0,0 +1,107 @@
+import os
+import numpy as np
+
+import torch
+from torch.utils.data import WeightedRandomSampler
+
+from masks import THRESHOLD
+
+STATS_INDEX_NAME = 'stats_index.npz'
+MAX_POINTS = 256
+
+
+## 샘플 하나의 통계 구하기
+def sample_stats(input, label, threshold=THRESHOLD, max_points=MAX_POINTS):
+    # 불량 픽셀 수, 불량 bounding box, 밝기 histogram, 불량 픽셀 좌표 (최대 max_points 개) 를 한 번에 구함
+    label = label.reshape(label.shape[0], label.shape[1], -1)[:, :, 0] >= threshold
+
+    yx = np.stack(np.nonzero(label), axis=1).astype(np.int32)
+    fg = len(yx)
+
+    # 불량 bounding box (y0, x0, y1, x1), 불량이 없으면 -1
+    if fg > 0:
+        bbox = (yx[:, 0].min(), yx[:, 1].min(), yx[:, 0].max() + 1, yx[:, 1].max() + 1)
+    else:
+        bbox = (-1, -1, -1, -1)
+
+    # patch 를 뽑을 때 쓸 불량 좌표는 샘플마다 같은 seed 로 골라서 다시 만들어도 같게 함
+    if fg > max_points:
+        yx = yx[np.random.default_rng(0).choice(fg, max_points, replace=False)]
+
+    hist = np.bincount(np.asarray(input, dtype=np.uint8).reshape(-1), minlength=256)
+
+    return fg, bbox, hist, yx
+
+
+## 통계 index 만들기
+def build_stats_index(dataset, threshold=THRESHOLD, max_points=MAX_POINTS, verbose=True):
+    # 저장된 샘플마다 불량 픽셀 수, 불량 bounding box, 밝기 histogram, 불량 좌표를 data_dir 에 저장
+    # (PatchDataset 의 불량 좌표와 balanced_sampler 가 같은 index 를 사용)
+    # 샘플 내용을 나타내는 dataset.sample_key 가 이전과 같은 샘플은 다시 계산하지 않음
+    path = os.path.join(dataset.data_dir, STATS_INDEX_NAME)
+
+    old = {}
+    if os.path.exists(path):
+        with np.load(path) as f:
+            if int(f['threshold']) == threshold and int(f['max_points']) == max_points:
+                offsets, points = f['offsets'], f['points']
+                for i, key in enumerate(f['keys']):
+                    old[str(key)] = (f['fg'][i], f['bbox'][i], f['hist'][i], points[offsets[i]:offsets[i + 1]])
+
+    num = dataset.num_stored()
+    keys = []
+    fg = np.zeros(num, dtype=np.int64)
+    bbox = np.zeros((num, 4), dtype=np.int32)
+    hist = np.zeros((num, 256), dtype=np.int64)
+    points = []
+
+    nnew = 0
+    for sid in range(num):
+        key = dataset.sample_key(sid)
+        keys.append(key)
+
+        if key in old:
+            fg[sid], bbox[sid], hist[sid], yx = old[key]
+        else:
+            input, label = dataset.read_stored(sid)
+            fg[sid], bbox[sid], hist[sid], yx = sample_stats(input, label, threshold, max_points)
+            nnew += 1
+        points.append(yx)
+
+    offsets = np.concatenate([[0], np.cumsum([len(yx) for yx in points])]).astype(np.int64)
+    points = np.concatenate(points).reshape(-1, 2).astype(np.int32) if points else np.zeros((0, 2), dtype=np.int32)
+
+    if nnew > 0 or len(old) != num:
+        np.savez(path, keys=np.array(keys), fg=fg, bbox=bbox, hist=hist, offsets=offsets, points=points,
+                 threshold=threshold, max_points=max_points)
+
+    if verbose:
+        print("STATS INDEX: %d samples | %d updated | %d with defects" % (num, nnew, int((fg > 0).sum())))
+
+    return {'fg': fg, 'bbox': bbox, 'hist': hist, 'offsets': offsets, 'points': points}
+
+
+## 불량 이미지를 더 자주 뽑는 sampler
+def balanced_weights(dataset, stats, fg_fraction=0.5):
+    # 한 epoch 에서 불량이 있는 이미지가 fg_fraction 비율로 뽑히도록 샘플별 가중치를 정함
+    sids = np.array([dataset.storage_id(i) for i in range(len(dataset))], dtype=np.int64)
+    has_fg = stats['fg'][sids] > 0
+
+    num_fg = int(has_fg.sum())
+    num_bg = len(has_fg) - num_fg
+
+    # 한쪽이 없으면 균등하게 뽑음
+    if num_fg == 0 or num_bg == 0:
+        return np.ones(len(has_fg), dtype=np.float64)
+
+    return np.where(has_fg, fg_fraction / num_fg, (1.0 - fg_fraction) / num_bg)
+
+
+def balanced_sampler(dataset, fg_fraction=0.5, num_samples=None):
+    stats = build_stats_index(dataset)
+    weights = balanced_weights(dataset, stats, fg_fraction)
+
+    if num_samples is None:
+        num_samples = len(weights)
+
+    return WeightedRandomSampler(torch.as_tensor(weights, dtype=torch.double), num_samples, replacement=True)
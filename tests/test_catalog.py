@@ -0,0 +1,77 @@
+import os
+
+from cache import file_hash
+from catalog import Catalog, CATALOG_NAME
+
+
+def write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def make_dir(tmp_path, ids):
+    for id in ids:
+        write(str(tmp_path / ('input_%s.npy' % id)), b'input ' + id.encode())
+        write(str(tmp_path / ('label_%s.npz' % id)), b'label ' + id.encode())
+    return str(tmp_path)
+
+
+def test_pairs_by_id_in_order(tmp_path):
+    data_dir = make_dir(tmp_path, ['0002', '0000', '0001'])
+    # 짝이 없는 파일은 건너뜀
+    write(os.path.join(data_dir, 'input_0003.npy'), b'x')
+
+    with Catalog(data_dir) as catalog:
+        assert len(catalog) == catalog.count() == 3
+        assert [catalog.at(i)['id'] for i in range(3)] == ['0000', '0001', '0002']
+        assert catalog.at(1)['label'] == 'label_0001.npz'
+        assert catalog.lookup('0002')['pos'] == 2
+        assert catalog.lookup('0003') is None
+
+
+def test_update_only_when_dir_changes(tmp_path):
+    data_dir = make_dir(tmp_path, ['0000', '0001'])
+
+    with Catalog(data_dir) as catalog:
+        assert catalog.update() == 0
+
+        make_dir(tmp_path, ['0002'])
+        assert catalog.update() == 1
+        assert len(catalog) == 3
+
+        os.remove(os.path.join(data_dir, 'label_0000.npz'))
+        assert catalog.update() == 1
+        assert catalog.at(0)['id'] == '0001'
+
+
+def test_hashes_are_lazy_and_follow_rewrites(tmp_path):
+    data_dir = make_dir(tmp_path, ['0000'])
+    input_path = os.path.join(data_dir, 'input_0000.npy')
+
+    with Catalog(data_dir) as catalog:
+        # 목록을 만들 때는 해시를 구하지 않음
+        assert catalog.at(0)['input_hash'] is None
+
+        h_input, h_label = catalog.hashes('0000')
+        assert h_input == file_hash(input_path)
+        assert catalog.at(0)['input_hash'] == h_input
+
+    # 다시 열어도 저장된 해시를 사용
+    with Catalog(data_dir) as catalog:
+        assert catalog.at(0)['input_hash'] == h_input
+
+        # 제자리에서 다시 쓴 파일은 해시를 다시 구함 (디렉토리 mtime 은 바뀌지 않음)
+        write(input_path, b'rewritten input')
+        assert catalog.at(0)['input_hash'] is None
+        assert catalog.hashes('0000') == (file_hash(input_path), h_label)
+
+
+def test_read_only_dir_in_memory(tmp_path, monkeypatch):
+    data_dir = make_dir(tmp_path, ['0000', '0001'])
+    monkeypatch.setattr(os, 'access', lambda path, mode: False)
+
+    catalog = Catalog(data_dir)
+    assert not os.path.exists(os.path.join(data_dir, CATALOG_NAME))
+    assert len(catalog) == 2
+    assert catalog.lookup('0001')['pos'] == 1
+    assert catalog.hashes('0000')[0] == file_hash(os.path.join(data_dir, 'input_0000.npy'))
@@ -0,0 +1,70 @@
+import os
+import numpy as np
+import pytest
+
+from data_read import tile_coords, pad_to_tile, cut_tiles, remove_samples
+
+
+def test_tile_coords_exact_fit():
+    assert tile_coords(512, 1024, 512) == [(0, 0), (512, 0)]
+
+
+def test_tile_coords_last_tile_aligned_to_edge():
+    # 마지막 tile 은 이미지 끝에 맞춰서 겹침
+    coords = tile_coords(512, 1100, 512)
+    assert coords == [(0, 0), (512, 0), (588, 0)]
+
+
+def test_tile_coords_overlap_covers_image():
+    h, w, tile = 700, 900, 256
+    coords = tile_coords(h, w, tile, overlap=64)
+
+    covered = np.zeros((h, w), dtype=bool)
+    for x, y in coords:
+        assert 0 <= x <= w - tile and 0 <= y <= h - tile
+        covered[y:y + tile, x:x + tile] = True
+    assert covered.all()
+
+    # stride 는 tile - overlap
+    xs = sorted(set(x for x, _ in coords))
+    assert xs[:3] == [0, 192, 384]
+
+
+def test_tile_coords_small_image_single_tile():
+    assert tile_coords(100, 300, 512) == [(0, 0)]
+
+
+def test_tile_coords_rejects_overlap_ge_tile():
+    with pytest.raises(ValueError):
+        tile_coords(512, 512, 256, overlap=256)
+
+
+def test_small_image_padded_to_full_tile():
+    input = np.arange(100 * 300, dtype=np.uint8).reshape(100, 300)
+    label = np.full((100, 300), 255, dtype=np.uint8)
+
+    coords = tile_coords(*input.shape, 512)
+    tiles = cut_tiles(input, coords, 512)
+    label_tiles = cut_tiles(label, coords, 512, mode='constant')
+
+    assert [t.shape for t in tiles] == [(512, 512)]
+    assert np.array_equal(tiles[0][:100, :300], input)
+    # 라벨은 배경 0 으로 채움
+    assert label_tiles[0][:100, :300].min() == 255
+    assert label_tiles[0][100:].max() == 0 and label_tiles[0][:, 300:].max() == 0
+
+
+def test_pad_to_tile_keeps_large_array():
+    arr = np.zeros((600, 600, 3), dtype=np.uint8)
+    assert pad_to_tile(arr, 512) is arr
+    assert pad_to_tile(arr[:100], 512).shape == (512, 600, 3)
+
+
+def test_remove_samples_clears_previous_run(tmp_path):
+    names = ['input_000_0000_0256.npy', 'label_000_0000_0256.npz', 'input_001.npy', 'label_001.npy']
+    for name in names + ['tile_index.npy', 'catalog.sqlite']:
+        (tmp_path / name).write_bytes(b'x')
+
+    remove_samples(str(tmp_path))
+
+    assert sorted(os.listdir(str(tmp_path))) == ['catalog.sqlite', 'tile_index.npy']
@@ -0,0 +1,37 @@
+from manifest import make_kfold, make_split
+
+
+def test_make_kfold_partitions_frames():
+    nframe, k = 83, 5
+    test = None
+    vals = []
+    for fold in range(k):
+        m = make_kfold(nframe, k, fold, seed=7)
+        s = m['splits']
+
+        assert m['kfold'] == [k, fold] and m['seed'] == 7
+        assert len(s['test']) == int(nframe / 8)
+        # 한 fold 안에서 train / val / test 는 겹치지 않고 전체를 덮음
+        assert sorted(s['train'] + s['val'] + s['test']) == list(range(nframe))
+
+        # test 는 fold 와 무관하게 고정
+        if test is None:
+            test = s['test']
+        assert s['test'] == test
+        vals.append(s['val'])
+
+    # fold 들의 val 을 합치면 test 를 뺀 나머지 전부
+    merged = sorted(i for v in vals for i in v)
+    assert merged == sorted(set(range(nframe)) - set(test))
+    assert max(len(v) for v in vals) - min(len(v) for v in vals) <= 1
+
+
+def test_make_kfold_deterministic():
+    assert make_kfold(50, 4, 1, seed=3) == make_kfold(50, 4, 1, seed=3)
+    assert make_kfold(50, 4, 1, seed=3)['splits'] != make_kfold(50, 4, 1, seed=4)['splits']
+
+
+def test_make_split_deterministic():
+    a = make_split(40, seed=1)
+    assert a == make_split(40, seed=1)
+    assert len(a['splits']['train']) == 30
@@ -0,0 +1,32 @@
+import numpy as np
+
+from masks import pack_mask, unpack_mask, packed_nbytes
+
+
+def test_pack_roundtrip():
+    rng = np.random.default_rng(0)
+    # 8 의 배수가 아닌 크기로 마지막 byte 의 padding 도 확인
+    mask = (rng.random((37, 53)) > 0.7).astype(np.uint8) * 255
+
+    bits = pack_mask(mask)
+    assert bits.dtype == np.uint8
+    assert bits.nbytes == packed_nbytes(mask.shape) == (37 * 53 + 7) // 8
+
+    out = unpack_mask(bits, mask.shape)
+    assert out.dtype == np.uint8
+    assert np.array_equal(out, mask)
+
+
+def test_pack_thresholds_soft_labels():
+    # resize 로 생긴 중간값은 threshold 기준으로 이진화
+    mask = np.array([[0, 127, 128, 255]], dtype=np.uint8)
+    assert unpack_mask(pack_mask(mask), mask.shape).tolist() == [[0, 0, 255, 255]]
+    assert unpack_mask(pack_mask(mask, threshold=100), mask.shape).tolist() == [[0, 255, 255, 255]]
+
+
+def test_pack_keeps_channel_axis():
+    mask = np.zeros((4, 6, 1), dtype=np.uint8)
+    mask[1, 2, 0] = 255
+    out = unpack_mask(pack_mask(mask), mask.shape)
+    assert out.shape == (4, 6, 1)
+    assert np.array_equal(out, mask)
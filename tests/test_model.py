@@ -0,0 +1,50 @@
+import torch
+import torch.nn as nn
+
+from model import UNet, fuse_conv_bn, fuse_unet
+
+
+def randomize_bn(net, seed=0):
+    # 학습된 것처럼 BatchNorm 통계 / scale 을 1 이 아닌 값으로 채움
+    g = torch.Generator().manual_seed(seed)
+    with torch.no_grad():
+        for m in net.modules():
+            if isinstance(m, nn.BatchNorm2d):
+                n = m.num_features
+                m.weight.copy_(torch.rand(n, generator=g) + 0.5)
+                m.bias.copy_(torch.randn(n, generator=g))
+                m.running_mean.copy_(torch.randn(n, generator=g))
+                m.running_var.copy_(torch.rand(n, generator=g) + 0.5)
+    return net
+
+
+def test_fuse_conv_bn_matches_conv_then_bn():
+    torch.manual_seed(0)
+    x = torch.randn(2, 3, 9, 11)
+    for bias in (True, False):
+        conv = nn.Conv2d(3, 5, kernel_size=3, padding=1, bias=bias)
+        bn = randomize_bn(nn.BatchNorm2d(5)).eval()
+
+        with torch.no_grad():
+            fused = fuse_conv_bn(conv, bn)
+            assert torch.allclose(fused(x), bn(conv(x)), atol=1e-5)
+
+
+def test_fuse_unet_matches_eval_model():
+    torch.manual_seed(0)
+    net = randomize_bn(UNet(base_channels=8, depth=3)).eval()
+    x = torch.randn(2, 1, 32, 32)
+
+    with torch.no_grad():
+        ref = net(x)
+        out = fuse_unet(net)(x)
+
+    assert out.shape == ref.shape
+    assert torch.allclose(out, ref, atol=1e-4)
+    # 원래 모델은 바뀌지 않음
+    assert isinstance(net.enc1_1[1], nn.BatchNorm2d)
+
+
+def test_pad_multiple_follows_depth():
+    assert UNet(base_channels=4).pad_multiple == 32
+    assert UNet(base_channels=8, depth=3).pad_multiple == 4
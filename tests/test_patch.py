@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from dataset import Dataset, PatchDataset, BatchCollate
+
+DEFECTS = [(3, 50), (60, 5), (30, 30)]
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    # 64x64 이미지 3 장, 각각 불량 픽셀이 하나씩
+    for i, (y, x) in enumerate(DEFECTS):
+        input = np.full((64, 64), i, dtype=np.uint8)
+        label = np.zeros((64, 64), dtype=np.uint8)
+        label[y, x] = 255
+        np.save(str(tmp_path / ('input_%03d.npy' % i)), input)
+        np.save(str(tmp_path / ('label_%03d.npy' % i)), label)
+    return Dataset(data_dir=str(tmp_path))
+
+
+def test_fg_patches_contain_defect(dataset):
+    patches = PatchDataset(dataset, patch_size=16, patches_per_image=20, fg_prob=1.0, seed=0)
+    assert len(patches) == 3
+
+    for index, (y, x) in enumerate(DEFECTS):
+        sample = patches[index]
+        assert len(sample) == 20
+        for data in sample:
+            # 이미지 밖으로 나가면 view 가 잘려서 patch_size 보다 작아짐
+            assert data['input'].shape == (16, 16, 1)
+            assert data['label'].shape == (16, 16, 1)
+            assert (data['input'] == index).all()
+            assert data['label'].max() == 255
+
+
+def test_corner_stays_inside_image(dataset):
+    patches = PatchDataset(dataset, patch_size=16, fg_prob=0.5, seed=1)
+    # 가장자리 불량 / 무작위 위치 / patch 보다 작은 이미지
+    for pts in (np.array([[0, 0], [63, 63]]), np.zeros((0, 2), dtype=np.int32)):
+        for _ in range(200):
+            top, left = patches._corner(64, 64, pts)
+            assert 0 <= top <= 48 and 0 <= left <= 48
+    assert patches._corner(10, 12, np.array([[5, 5]])) == (0, 0)
+
+
+def test_bg_patches_are_random(dataset):
+    patches = PatchDataset(dataset, patch_size=16, patches_per_image=50, fg_prob=0.0, seed=0)
+    corners = set(patches._corner(64, 64, np.array([[3, 50]])) for _ in range(50))
+    assert len(corners) > 10
+
+
+def test_same_seed_same_patches(dataset):
+    a = PatchDataset(dataset, patch_size=16, patches_per_image=4, seed=3)
+    b = PatchDataset(dataset, patch_size=16, patches_per_image=4, seed=3)
+    for pa, pb in zip(a[0], b[0]):
+        assert np.array_equal(pa['label'], pb['label'])
+
+
+def test_batch_collate_flattens_patches(dataset):
+    patches = PatchDataset(dataset, patch_size=16, patches_per_image=4, seed=0)
+    batch = BatchCollate()([patches[0], patches[1]])
+    assert tuple(batch['input'].shape) == (8, 16, 16, 1)
+    assert batch['input'][:4].eq(0).all() and batch['input'][4:].eq(1).all()
@@ -0,0 +1,60 @@
+import torch
+
+from model import UNet
+from prune import default_layers, select_channels, prune_unet, count_params
+
+from test_model import randomize_bn
+
+
+def small_unet():
+    torch.manual_seed(0)
+    return randomize_bn(UNet(base_channels=8, depth=3)).eval()
+
+
+def test_select_channels_keeps_sorted_subset():
+    net = small_unet()
+    layers = default_layers(net)
+    keep = select_channels(net, layers, amount=0.5, min_channels=2)
+
+    assert set(keep) == set(net.channels)
+    for name, idx in keep.items():
+        n = net.channels[name]
+        if name in layers:
+            assert len(idx) == max(2, round(n * 0.5))
+        else:
+            assert idx.tolist() == list(range(n))
+        assert idx.tolist() == sorted(set(idx.tolist()))
+        assert 0 <= int(idx.min()) and int(idx.max()) < n
+
+
+def test_select_channels_min_channels():
+    net = small_unet()
+    keep = select_channels(net, ['enc1_1'], amount=0.99, min_channels=3)
+    assert len(keep['enc1_1']) == 3
+
+
+def test_prune_unet_shapes_consistent():
+    net = small_unet()
+    keep = select_channels(net, default_layers(net), amount=0.5, min_channels=2)
+    pruned = prune_unet(net, keep).eval()
+
+    assert pruned.channels == {name: len(idx) for name, idx in keep.items()}
+    assert count_params(pruned) < count_params(net)
+
+    # 지운 채널에 맞춰 다음 층의 입력 채널도 줄어서 forward 가 그대로 동작
+    x = torch.randn(2, 1, 16, 16)
+    with torch.no_grad():
+        assert pruned(x).shape == net(x).shape
+
+    # 다시 만든 설정으로 같은 구조가 나옴 (checkpoint 로 저장 / 불러오기 가능)
+    rebuilt = UNet(**pruned.config)
+    rebuilt.load_state_dict(pruned.state_dict())
+
+
+def test_prune_nothing_is_identity():
+    net = small_unet()
+    pruned = prune_unet(net, select_channels(net, default_layers(net), amount=0.0)).eval()
+
+    x = torch.randn(2, 1, 16, 16)
+    with torch.no_grad():
+        assert torch.allclose(pruned(x), net(x), atol=1e-6)
@@ -0,0 +1,96 @@
+import numpy as np
+
+from stats import sample_stats, build_stats_index, balanced_weights
+
+
+class FakeDataset(object):
+    # build_stats_index / balanced_weights 가 쓰는 부분만 있는 저장소
+    def __init__(self, data_dir, labels, split_ids=None):
+        self.data_dir = str(data_dir)
+        self.labels = labels
+        self.keys = ['v1 %d' % i for i in range(len(labels))]
+        self.split_ids = list(range(len(labels))) if split_ids is None else split_ids
+        self.reads = 0
+
+    def num_stored(self):
+        return len(self.labels)
+
+    def sample_key(self, sid):
+        return self.keys[sid]
+
+    def read_stored(self, sid):
+        self.reads += 1
+        label = self.labels[sid]
+        return np.full(label.shape, 100, dtype=np.uint8), label
+
+    def storage_id(self, index):
+        return self.split_ids[index]
+
+    def __len__(self):
+        return len(self.split_ids)
+
+
+def make_label(box=None, shape=(16, 16)):
+    label = np.zeros(shape + (1,), dtype=np.uint8)
+    if box is not None:
+        y0, x0, y1, x1 = box
+        label[y0:y1, x0:x1] = 255
+    return label
+
+
+def test_sample_stats():
+    fg, bbox, hist, yx = sample_stats(np.full((16, 16), 7, dtype=np.uint8), make_label((2, 3, 5, 9)))
+    assert fg == 3 * 6
+    assert tuple(bbox) == (2, 3, 5, 9)
+    assert hist[7] == 256 and hist.sum() == 256
+    assert len(yx) == fg
+
+    fg, bbox, _, yx = sample_stats(np.zeros((16, 16), dtype=np.uint8), make_label())
+    assert fg == 0 and tuple(bbox) == (-1, -1, -1, -1) and len(yx) == 0
+
+
+def test_sample_stats_caps_points_deterministically():
+    label = make_label((0, 0, 16, 16))
+    _, _, _, a = sample_stats(np.zeros((16, 16), dtype=np.uint8), label, max_points=10)
+    _, _, _, b = sample_stats(np.zeros((16, 16), dtype=np.uint8), label, max_points=10)
+    assert len(a) == 10 and np.array_equal(a, b)
+
+
+def test_build_stats_index_reuses_unchanged_samples(tmp_path):
+    labels = [make_label((0, 0, 2, 2)), make_label(), make_label((4, 4, 8, 8))]
+    dataset = FakeDataset(tmp_path, labels)
+
+    stats = build_stats_index(dataset, verbose=False)
+    assert dataset.reads == 3
+    assert stats['fg'].tolist() == [4, 0, 16]
+    assert stats['offsets'].tolist() == [0, 4, 4, 20]
+
+    # 그대로면 다시 읽지 않음
+    dataset.reads = 0
+    again = build_stats_index(dataset, verbose=False)
+    assert dataset.reads == 0
+    assert np.array_equal(again['points'], stats['points'])
+
+    # 내용이 바뀐 샘플만 다시 계산
+    dataset.labels[1] = make_label((0, 0, 1, 1))
+    dataset.keys[1] = 'v2 1'
+    stats = build_stats_index(dataset, verbose=False)
+    assert dataset.reads == 1
+    assert stats['fg'].tolist() == [4, 1, 16]
+
+
+def test_balanced_weights_fg_fraction():
+    # split 의 샘플 4 개 중 저장 위치 0, 2 에만 불량
+    stats = {'fg': np.array([5, 0, 3, 0, 0, 9])}
+    dataset = FakeDataset('.', [None] * 6, split_ids=[0, 1, 2, 3])
+
+    w = balanced_weights(dataset, stats, fg_fraction=0.8)
+    assert len(w) == 4
+    assert np.isclose(w[[0, 2]].sum(), 0.8) and np.isclose(w[[1, 3]].sum(), 0.2)
+    assert np.isclose(w.sum(), 1.0)
+
+
+def test_balanced_weights_one_class_is_uniform():
+    stats = {'fg': np.array([0, 0, 0])}
+    dataset = FakeDataset('.', [None] * 3)
+    assert balanced_weights(dataset, stats).tolist() == [1.0, 1.0, 1.0]
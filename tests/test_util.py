@@ -0,0 +1,38 @@
+import os
+
+import torch
+
+from model import UNet
+from util import save, load_net, is_fresh
+
+
+def test_load_net_rebuilds_saved_arch(tmp_path):
+    torch.manual_seed(0)
+    net = UNet(base_channels=4, depth=3)
+    optim = torch.optim.Adam(net.parameters())
+    save(ckpt_dir=str(tmp_path), net=net, optim=optim, epoch=2, name='small', loss=0.1, iou=0.5, acc=90.0,
+         lr=1e-3, batch=2, precision='bf16')
+
+    loaded = load_net(os.path.join(str(tmp_path), 'small_model.pth')).eval()
+    assert loaded.config == net.config
+    assert loaded.precision == 'bf16'
+
+    x = torch.randn(1, 1, 16, 16)
+    with torch.no_grad():
+        assert torch.equal(loaded(x), net.eval()(x))
+
+
+def test_is_fresh(tmp_path):
+    ckpt = str(tmp_path / 'a_model.pth')
+    artifact = str(tmp_path / 'a_model.onnx')
+    open(ckpt, 'wb').close()
+
+    assert not is_fresh(artifact, ckpt)
+
+    open(artifact, 'wb').close()
+    os.utime(ckpt, (100, 100))
+    os.utime(artifact, (200, 200))
+    assert is_fresh(artifact, ckpt)
+
+    os.utime(ckpt, (300, 300))
+    assert not is_fresh(artifact, ckpt)
@@ -10,19 +10,40 @@ import torch
 import torch.nn as nn
 from torch.utils.data import DataLoader
 from torch.utils.tensorboard import SummaryWriter
-from model import UNet
+from model import UNet, build_unet
+from data_read import IMG_SIZE
 from dataset import *
 from util import *
+from stats import *
+from inference import *
 import matplotlib.pyplot as plt
 from torchvision import transforms, datasets
 import gc
+import time
 
 
-def train(lr=0, batch_size=0, num_epoch=0, mode='test', name='', model1='train', model2=''):
+def train(lr=0, batch_size=0, num_epoch=0, mode='test', name='', model1='train', model2='', stream=False,
+          cache_bytes=0, batch_transform=False, num_workers=0, pin_memory=None, persistent_workers=True,
+          prefetch_factor=2, patch_size=None, patches_per_image=8, fg_prob=0.5,
+          balanced=False, fg_fraction=0.5, augment=False, arch='current', checkpointing=False, precision=None,
+          backend='eager', infer_dir='./test/', infer_size=None, save_output=True):
 
     # train lr, batch_size, num_epoch,mode = 'test', name
     # test  lr, batch_size, num_epoch,mode='test',name, model1 = 해당 모델 경로
     # compare batch_size,mode='compare',model1 = 해당 모델 경로, model2 = 해당 모델 경로
+    # stream=True 이면 data_read 없이 datasets/Imgs, datasets/labels 를 학습 중에 바로 전처리
+    # cache_bytes 를 주면 train / val 각각 그 크기 안에서 샘플을 메모리에 캐시해서 두 번째 epoch 부터 disk 를 읽지 않음
+    # batch_transform=True 이면 normalization / flip / dtype 변환을 uint8 batch tensor 에 한 번에 적용
+    # num_workers, pin_memory, persistent_workers, prefetch_factor 는 DataLoader 설정
+    # patch_size 를 주면 train 은 이미지 한 장당 patches_per_image 개의 patch 로 학습 (fg_prob 확률로 불량 주변)
+    # balanced=True 이면 통계 index 를 보고 불량이 있는 이미지가 fg_fraction 비율로 뽑히도록 train 을 샘플링
+    # augment=True 이면 rot90 / affine / 밝기 / 대비 / noise augmentation 을 batch 로 적용 (batch_transform 도 켜짐)
+    # arch 는 train 할 UNet 설정 (tiny / small / base / current 또는 UNet 인자 dict), test / compare 는 checkpoint 의 설정을 사용
+    # checkpointing=True 이면 CBR2d 두 개 단위로 activation 을 다시 계산해서 학습 메모리를 줄임 (고해상도 / 큰 batch 용)
+    # precision='bf16' 이면 forward / loss 를 bfloat16 autocast 로 계산 (backward 도 같은 dtype 을 따름), checkpoint 에 기록
+    # precision 을 주지 않으면 train 은 fp32, test / compare / infer 는 checkpoint 에 기록된 precision 을 사용
+    # backend 는 test / compare / infer 에서 사용할 추론 방식 (inference.BACKENDS)
+    # infer    batch_size, mode='infer', name, model1 = 해당 모델 경로, infer_dir = 라벨 없는 이미지 폴더
 
     gc.collect()
     torch.cuda.empty_cache()
@@ -45,6 +66,20 @@ def train(lr=0, batch_size=0, num_epoch=0, mode='test', name='', model1='train',
 
     mode = mode
     train_continue = "off"
+
+    # augmentation 은 batch transform 으로만 구현되어 있으므로 batch 경로를 켬
+    if augment:
+        batch_transform = True
+
+    # StreamDataset 은 스스로 섞으므로 sampler 를 붙일 수 없음
+    if balanced and stream:
+        raise ValueError("balanced=True needs a stored Dataset (run data_read first); it cannot be used with stream=True")
+
+    # 라벨이 없는 이미지는 loss / IoU 없이 추론만 함
+    if mode == 'infer':
+        return infer(name=name, model1=model1, data_dir=infer_dir, batch_size=batch_size or 1, size=infer_size,
+                     num_workers=num_workers, pin_memory=pin_memory, backend=backend, precision=precision,
+                     save_output=save_output)
     name = name
 
     data_dir = "./datasets"  # 데이터셋 저장 디렉토리
@@ -106,35 +141,84 @@ def train(lr=0, batch_size=0, num_epoch=0, mode='test', name='', model1='train',
             os.makedirs(os.path.join(compare_dir, 'numpy/output1'))
             os.makedirs(os.path.join(compare_dir, 'numpy/output2'))
 
+    loader_kwargs = loader_config(num_workers=num_workers, pin_memory=pin_memory,
+                                  persistent_workers=persistent_workers, prefetch_factor=prefetch_factor)
+
     # 네트워크 학습하기
     if mode == 'train':
-        transform = transforms.Compose(
-            [Normalization(mean=0.5, std=0.5), RandomFlip(), ToTensor()])
-
-        dataset_train = Dataset(data_dir=os.path.join(
-            data_dir, 'train'), transform=transform)
+        if batch_transform:
+            transform = ToTensorUint8()
+            collate_train = BatchCollate(transforms.Compose(
+                [BatchRandomFlip(), BatchNormalization(mean=0.5, std=0.5)]))
+            collate_val = collate_train
+            if augment:
+                collate_train = BatchCollate(batch_augmentation(mean=0.5, std=0.5))
+        else:
+            transform = transforms.Compose(
+                [RandomFlip(), Normalization(mean=0.5, std=0.5), ToTensor()])
+            collate_train = collate_val = None
+
+        if stream:
+            dataset_train = StreamDataset(data_dir=data_dir, split='train', transform=transform)
+            dataset_val = StreamDataset(data_dir=data_dir, split='val', transform=transform, shuffle=False)
+        else:
+            if patch_size:
+                # val 은 전체 이미지로 평가
+                dataset_train = PatchDataset(Dataset(data_dir=data_dir, split='train', cache_bytes=cache_bytes),
+                                             patch_size=patch_size, patches_per_image=patches_per_image,
+                                             fg_prob=fg_prob, transform=transform)
+            else:
+                dataset_train = Dataset(data_dir=data_dir, split='train', transform=transform,
+                                        cache_bytes=cache_bytes)
+            dataset_val = Dataset(data_dir=data_dir, split='val', transform=transform,
+                                  cache_bytes=cache_bytes)
+
+        sampler_train = None
+        if balanced:
+            if patch_size:
+                # PatchDataset 의 샘플 번호는 이미지 번호와 같음
+                sampler_train = balanced_sampler(dataset_train.dataset, fg_fraction=fg_fraction)
+            else:
+                sampler_train = balanced_sampler(dataset_train, fg_fraction=fg_fraction)
+
+        # patch 는 이미지 한 장에서 patches_per_image 개씩 나오므로 batch 당 patch 수가 batch_size 가 되도록 이미지 수를 줄임
+        batch_size_train = batch_size
+        if patch_size and not stream:
+            batch_size_train = max(1, batch_size // patches_per_image)
+            if collate_train is None:
+                collate_train = BatchCollate()
+
+        # IterableDataset 은 스스로 섞고, sampler 를 쓰면 sampler 가 섞으므로 DataLoader 의 shuffle 을 쓰지 않음
         loader_train = DataLoader(
-            dataset_train, batch_size=batch_size, shuffle=True, num_workers=0)
+            dataset_train, batch_size=batch_size_train, shuffle=not stream and sampler_train is None,
+            sampler=sampler_train, collate_fn=collate_train, **loader_kwargs)
 
-        dataset_val = Dataset(data_dir=os.path.join(
-            data_dir, 'val'), transform=transform)
         loader_val = DataLoader(
-            dataset_val, batch_size=batch_size, shuffle=False, num_workers=0)
+            dataset_val, batch_size=batch_size, shuffle=False,
+            collate_fn=collate_val, **loader_kwargs)
 
         # 그밖에 부수적인 variables 설정하기
         num_data_train = len(dataset_train)
         num_data_val = len(dataset_val)
 
-        num_batch_train = np.ceil(num_data_train / batch_size)
+        num_batch_train = np.ceil(num_data_train / batch_size_train)
         num_batch_val = np.ceil(num_data_val / batch_size)
     else:
-        transform = transforms.Compose(
-            [Normalization(mean=0.5, std=0.5), ToTensor()])
-
-        dataset_test = Dataset(data_dir=os.path.join(
-            data_dir, 'test'), transform=transform)
+        if batch_transform:
+            transform = ToTensorUint8()
+            collate_test = BatchCollate(BatchNormalization(mean=0.5, std=0.5))
+        else:
+            transform = transforms.Compose(
+                [Normalization(mean=0.5, std=0.5), ToTensor()])
+            collate_test = None
+
+        if stream:
+            dataset_test = StreamDataset(data_dir=data_dir, split='test', transform=transform, shuffle=False)
+        else:
+            dataset_test = Dataset(data_dir=data_dir, split='test', transform=transform)
         loader_test = DataLoader(
-            dataset_test, batch_size=batch_size, shuffle=False, num_workers=0)
+            dataset_test, batch_size=batch_size, shuffle=False,
+            collate_fn=collate_test, **loader_kwargs)
 
         # 그밖에 부수적인 variables 설정하기
         num_data_test = len(dataset_test)
@@ -142,7 +226,9 @@ def train(lr=0, batch_size=0, num_epoch=0, mode='test', name='', model1='train',
         num_batch_test = np.ceil(num_data_test / batch_size)
 
     # 네트워크 생성하기
-    net = UNet().to(device)
+    net = build_unet(arch).to(device)
+    if mode == 'train' and checkpointing:
+        net.set_checkpointing(True)
     if mode == 'compare':
         net1 = UNet().to(device)
         net2 = UNet().to(device)
@@ -160,6 +246,7 @@ def train(lr=0, batch_size=0, num_epoch=0, mode='test', name='', model1='train',
 
     def fn_denorm(x, mean, std): return (x * std) + mean
     def fn_class(x): return 1.0 * (x > 0.5)
+    def fn_autocast(p=None): return autocast(device, p or precision)
 
     # Tensorboard 를 사용하기 위한 SummaryWriter 설정
     writer_train = SummaryWriter(log_dir=os.path.join(log_dir, 'train'))
@@ -174,22 +261,30 @@ def train(lr=0, batch_size=0, num_epoch=0, mode='test', name='', model1='train',
         if train_continue == "on":
             net, optim, st_epoch = load(
                 ckpt_dir=ckpt_dir, net=net, optim=optim)
+            precision = precision or getattr(net, 'precision', 'fp32')
+        precision = precision or 'fp32'
 
         for epoch in range(st_epoch + 1, num_epoch + 1):
+            # StreamDataset 은 persistent worker 에서도 epoch 마다 다른 순서로 섞이도록 epoch 를 넘김
+            if stream:
+                dataset_train.set_epoch(epoch)
+
             net.train()
             loss_arr = []
             iou_arr = []
             for batch, data in enumerate(loader_train, 1):
                 # forward pass
-                label = data['label'].to(device)
-                input = data['input'].to(device)
+                label = data['label'].to(device, non_blocking=True)
+                input = data['input'].to(device, non_blocking=True)
 
-                output = net(input)
+                with fn_autocast():
+                    output = net(input)
+
+                    loss = fn_loss(output, label)
 
                 # backward pass
                 optim.zero_grad()
 
-                loss = fn_loss(output, label)
                 loss.backward()
 
                 optim.step()
@@ -226,13 +321,14 @@ def train(lr=0, batch_size=0, num_epoch=0, mode='test', name='', model1='train',
                 acc = 0
                 for batch, data in enumerate(loader_val, 1):
                     # forward pass
-                    label = data['label'].to(device)
-                    input = data['input'].to(device)
+                    label = data['label'].to(device, non_blocking=True)
+                    input = data['input'].to(device, non_blocking=True)
 
-                    output = net(input)
+                    with fn_autocast():
+                        output = net(input)
 
-                    # 손실함수 계산하기
-                    loss = fn_loss(output, label)
+                        # 손실함수 계산하기
+                        loss = fn_loss(output, label)
 
                     loss_arr += [loss.item()]
 
@@ -252,7 +348,8 @@ def train(lr=0, batch_size=0, num_epoch=0, mode='test', name='', model1='train',
                         best_loss = np.mean(loss_arr)
                         # SAVE
                         best_save(ckpt_dir=ckpt_dir, net=net,
-                                  optim=optim, epoch=epoch, name=name, loss=np.mean(loss_arr), iou=np.mean(iou_arr), acc=acc, lr=lr, batch=batch_size)
+                                  optim=optim, epoch=epoch, name=name, loss=np.mean(loss_arr), iou=np.mean(iou_arr), acc=acc, lr=lr, batch=batch_size,
+                                  precision=precision)
 
                     writer_val.add_image(
                         'label', label, num_batch_val * (epoch - 1) + batch, dataformats='NHWC')
@@ -266,7 +363,8 @@ def train(lr=0, batch_size=0, num_epoch=0, mode='test', name='', model1='train',
 
             if epoch == num_epoch:
                 save(ckpt_dir=ckpt_dir, net=net,
-                     optim=optim, epoch=epoch, name=name, loss=np.mean(loss_arr), iou=np.mean(iou_arr), acc=acc, lr=lr, batch=batch_size)
+                     optim=optim, epoch=epoch, name=name, loss=np.mean(loss_arr), iou=np.mean(iou_arr), acc=acc, lr=lr, batch=batch_size,
+                     precision=precision)
 
         writer_train.close()
         writer_val.close()
@@ -275,6 +373,9 @@ def train(lr=0, batch_size=0, num_epoch=0, mode='test', name='', model1='train',
     elif mode == 'test':
         net, optim, st_epoch = load(
             ckpt_dir=ckpt_dir, net=net, optim=optim, name=model_name)
+        precision = precision or getattr(net, 'precision', 'fp32')
+        net = prepare_inference(net, backend, ckpt_path=os.path.join(ckpt_dir, model_name),
+                                example_shape=(batch_size, 1) + IMG_SIZE)
 
         with torch.no_grad():
             net.eval()
@@ -284,13 +385,14 @@ def train(lr=0, batch_size=0, num_epoch=0, mode='test', name='', model1='train',
 
             for batch, data in enumerate(loader_test, 1):
                 # forward pass
-                label = data['label'].to(device)
-                input = data['input'].to(device)
+                label = data['label'].to(device, non_blocking=True)
+                input = data['input'].to(device, non_blocking=True)
 
-                output = net(input)
+                with fn_autocast():
+                    output = net(input)
 
-                # 손실함수 계산하기
-                loss = fn_loss(output, label)
+                    # 손실함수 계산하기
+                    loss = fn_loss(output, label)
 
                 loss_arr += [loss.item()]
 
@@ -364,6 +466,13 @@ def train(lr=0, batch_size=0, num_epoch=0, mode='test', name='', model1='train',
         net2, optim2, st_epoch2 = load_compare(
             net=net2, optim=optim, path=model2_name)
 
+        # 두 모델이 서로 다른 precision 으로 학습되었을 수 있으므로 따로 정함
+        precision1 = precision or getattr(net1, 'precision', 'fp32')
+        precision2 = precision or getattr(net2, 'precision', 'fp32')
+
+        net1 = prepare_inference(net1, backend, ckpt_path=model1_name, example_shape=(batch_size, 1) + IMG_SIZE)
+        net2 = prepare_inference(net2, backend, ckpt_path=model2_name, example_shape=(batch_size, 1) + IMG_SIZE)
+
         with torch.no_grad():
             net1.eval()
             net2.eval()
@@ -376,20 +485,22 @@ def train(lr=0, batch_size=0, num_epoch=0, mode='test', name='', model1='train',
 
             for batch, data in enumerate(loader_test, 1):
                 # forward pass
-                label = data['label'].to(device)
-                input = data['input'].to(device)
+                label = data['label'].to(device, non_blocking=True)
+                input = data['input'].to(device, non_blocking=True)
 
-                output1 = net1(input)
+                with fn_autocast(precision1):
+                    output1 = net1(input)
 
-                # 손실함수 계산하기
-                loss1 = fn_loss(output1, label)
+                    # 손실함수 계산하기
+                    loss1 = fn_loss(output1, label)
 
                 loss_arr1 += [loss1.item()]
 
-                output2 = net2(input)
+                with fn_autocast(precision2):
+                    output2 = net2(input)
 
-                # 손실함수 계산하기
-                loss2 = fn_loss(output2, label)
+                    # 손실함수 계산하기
+                    loss2 = fn_loss(output2, label)
 
                 loss_arr2 += [loss2.item()]
 
@@ -490,3 +601,79 @@ def train(lr=0, batch_size=0, num_epoch=0, mode='test', name='', model1='train',
               (batch, num_batch_test, np.mean(loss_arr1), np.mean(iou_arr1)))
         print("AVERAGE TEST2: BATCH %04d / %04d | LOSS %.4f | IoU %.4f" %
               (batch, num_batch_test, np.mean(loss_arr2), np.mean(iou_arr2)))
+
+
+def infer(name='', model1='', data_dir='./test/', batch_size=1, size=None, num_workers=0, pin_memory=None,
+          decoder='pil', backend='eager', precision=None, save_output=True):
+    # 라벨 없는 이미지 폴더를 추론해서 mask 를 result/<모델>/infer/ 에 저장
+    # 라벨 / loss / IoU 계산을 하지 않으므로 순수 추론 처리량을 잴 수 있음 (save_output=False 이면 저장도 생략)
+    ckpt_dir = "./checkpoint/" + name
+    model_name = os.path.basename(model1)
+    result_dir = os.path.join("./result/" + model_name.replace(".pth", ""), 'infer')
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+    print("infer dir: %s" % data_dir)
+    print("infer model %s" % model_name)
+
+    if save_output and not os.path.exists(result_dir):
+        os.makedirs(result_dir)
+
+    # 크기가 제각각인 원본 해상도는 batch 로 묶을 수 없음
+    if size is None:
+        batch_size = 1
+
+    net = UNet().to(device)
+    optim = torch.optim.Adam(net.parameters())
+    net, optim, st_epoch = load(ckpt_dir=ckpt_dir, net=net, optim=optim, name=model_name)
+    precision = precision or getattr(net, 'precision', 'fp32')
+
+    # pad 배수는 checkpoint 의 UNet depth 로 정함 (backend 로 감싸기 전에 읽어 둠)
+    dataset_infer = InferenceDataset(data_dir, size=size, decoder=decoder, pad_multiple=net.pad_multiple)
+    loader_infer = DataLoader(
+        dataset_infer, batch_size=batch_size, shuffle=False,
+        **loader_config(num_workers=num_workers, pin_memory=pin_memory))
+
+    # size 를 주면 모든 입력 크기가 같으므로 그 크기로 compile 하고, 원본 해상도면 dynamic shape 로 compile
+    example_shape = (batch_size, 1, size[1], size[0]) if size is not None else (1, 1) + IMG_SIZE
+    net = prepare_inference(net, backend, ckpt_path=os.path.join(ckpt_dir, model_name),
+                            example_shape=example_shape, dynamic=size is None)
+
+    num_frame = 0
+    time_net = 0.0
+    st = time.time()
+
+    with torch.no_grad():
+        net.eval()
+        for batch, data in enumerate(loader_infer, 1):
+            input = data['input'].to(device, non_blocking=True)
+
+            # 모델 시간만 따로 재기 위해 GPU 면 동기화
+            if device.type == 'cuda':
+                torch.cuda.synchronize()
+            st_net = time.time()
+
+            with autocast(device, precision):
+                output = net(input)
+
+            if device.type == 'cuda':
+                torch.cuda.synchronize()
+            time_net += time.time() - st_net
+            num_frame += input.shape[0]
+
+            if save_output:
+                output = (output > 0.5).to('cpu').numpy().astype(np.uint8) * 255
+                for j in range(output.shape[0]):
+                    h, w = data['shape'][j].tolist()
+                    cv2.imwrite(os.path.join(result_dir, os.path.splitext(data['name'][j])[0] + '.png'),
+                                output[j, 0, :h, :w])
+
+            print("INFER: BATCH %04d / %04d" % (batch, len(loader_infer)))
+
+    time_total = time.time() - st
+
+    print("AVERAGE INFER: %d frames | model %.2f frames/s (%.1f ms/frame) | total %.2f frames/s" %
+          (num_frame, num_frame / max(time_net, 1e-9), time_net * 1000 / max(num_frame, 1),
+           num_frame / max(time_total, 1e-9)))
+
+    return num_frame / max(time_net, 1e-9)
@@ -1,39 +1,77 @@
 import os
+import contextlib
 import numpy as np
 
 import torch
 import torch.nn as nn
 
+from model import UNet, unet_config
+
 # 네트워크 저장하기
 
 
-def save(ckpt_dir, net, optim, epoch, name, loss, iou, acc, lr, batch):
+def save(ckpt_dir, net, optim, epoch, name, loss, iou, acc, lr, batch, precision='fp32'):
     if not os.path.exists(ckpt_dir):
         os.makedirs(ckpt_dir)
 
-    torch.save({'net': net.state_dict(), 'optim': optim.state_dict(), 'epoch': epoch, 'loss': loss, 'iou': iou, 'acc': acc, 'lr': lr, 'batch': batch, 'name': name},
+    torch.save({'net': net.state_dict(), 'optim': optim.state_dict(), 'epoch': epoch, 'loss': loss, 'iou': iou, 'acc': acc, 'lr': lr, 'batch': batch, 'name': name,
+                'arch': getattr(net, 'config', None), 'precision': precision},
                "%s/%s_model.pth" % (ckpt_dir, name))
 
 
-def best_save(ckpt_dir, net, optim, epoch, name, loss, iou, acc, lr, batch):
+def best_save(ckpt_dir, net, optim, epoch, name, loss, iou, acc, lr, batch, precision='fp32'):
     if not os.path.exists(ckpt_dir):
         os.makedirs(ckpt_dir)
-    torch.save({'net': net.state_dict(), 'optim': optim.state_dict(), 'epoch': epoch, 'loss': loss, 'iou': iou, 'acc': acc, 'lr': lr, 'batch': batch, 'name': name},
+    torch.save({'net': net.state_dict(), 'optim': optim.state_dict(), 'epoch': epoch, 'loss': loss, 'iou': iou, 'acc': acc, 'lr': lr, 'batch': batch, 'name': name,
+                'arch': getattr(net, 'config', None), 'precision': precision},
                "%s/%s_best_model.pth" % (ckpt_dir, name))
 
+# 연산 정밀도
+
+PRECISIONS = ('fp32', 'bf16')
+
+
+def autocast(device, precision='fp32'):
+    # bf16 은 fp32 와 지수 범위가 같아서 fp16 과 달리 loss scaling 이 필요 없음
+    # (AMX / AVX512-BF16 이 있는 CPU 나 bf16 을 지원하는 GPU 에서 빨라짐)
+    if precision not in PRECISIONS:
+        raise ValueError("unknown precision: %s (choose from %s)" % (precision, ', '.join(PRECISIONS)))
+    # fp32 는 autocast 를 아예 열지 않음
+    if precision == 'fp32':
+        return contextlib.nullcontext()
+    return torch.autocast(device_type=device.type, dtype=torch.bfloat16)
+
 # 네트워크 불러오기
 
 
+def rebuild(net, optim, dict_model):
+    # checkpoint 의 UNet 설정이 지금 net 과 다르면 같은 구조로 다시 만들고 optimizer 도 새 parameter 로 다시 만듦
+    # arch 가 없는 예전 checkpoint 는 기본 UNet
+    arch = dict_model.get('arch') or {}
+    if isinstance(net, UNet) and unet_config(**arch) == net.config:
+        return net, optim
+
+    device = next(net.parameters()).device
+    net = UNet(**arch).to(device)
+    optim = type(optim)(net.parameters(), **optim.defaults)
+
+    return net, optim
+
+
 def load_compare(net, optim, path):
     if not os.path.exists(path):
         epoch = 0
         return net, optim, epoch
 
-    dict_model = torch.load(path)
+    # GPU 에서 학습한 checkpoint 도 CPU 만 있는 PC 에서 읽을 수 있도록 CPU 로 읽은 뒤 net 의 device 로 복사
+    dict_model = torch.load(path, map_location='cpu')
 
+    net, optim = rebuild(net, optim, dict_model)
     net.load_state_dict(dict_model['net'])
     optim.load_state_dict(dict_model['optim'])
     epoch = dict_model['epoch']
+    # 학습할 때의 precision 을 net 에 붙여 둠 (precision 이 없는 예전 checkpoint 는 fp32)
+    net.precision = dict_model.get('precision', 'fp32')
 
     return net, optim, epoch
 
@@ -43,20 +81,40 @@ def load(ckpt_dir, net, optim, name):
         epoch = 0
         return net, optim, epoch
 
-    dict_model = torch.load('%s/%s' % (ckpt_dir, name))
+    dict_model = torch.load('%s/%s' % (ckpt_dir, name), map_location='cpu')
 
+    net, optim = rebuild(net, optim, dict_model)
     net.load_state_dict(dict_model['net'])
     optim.load_state_dict(dict_model['optim'])
     epoch = dict_model['epoch']
+    # 학습할 때의 precision 을 net 에 붙여 둠 (precision 이 없는 예전 checkpoint 는 fp32)
+    net.precision = dict_model.get('precision', 'fp32')
 
     return net, optim, epoch
 
 
+def load_net(path, device='cpu'):
+    # 추론 / 내보내기 / 양자화 / pruning 용으로 checkpoint 의 UNet 만 읽기 (optimizer 는 만들지 않음)
+    # 저장된 arch 로 같은 구조를 만들고, 학습할 때의 precision 을 net 에 붙여 둠
+    dict_model = torch.load(path, map_location='cpu')
+
+    net = UNet(**(dict_model.get('arch') or {}))
+    net.load_state_dict(dict_model['net'])
+    net.precision = dict_model.get('precision', 'fp32')
+
+    return net.to(device)
+
+
+def is_fresh(artifact, ckpt_path):
+    # checkpoint 에서 만든 파일 (script / int8 / onnx) 이 있고 checkpoint 보다 새것인지
+    return os.path.exists(artifact) and os.path.getmtime(artifact) >= os.path.getmtime(ckpt_path)
+
+
 def info_load(path):
     if not os.path.exists(path):
         return 0
 
-    dict_model = torch.load(path)
+    dict_model = torch.load(path, map_location='cpu')
 
     epoch = dict_model['epoch']
     loss = dict_model['loss']